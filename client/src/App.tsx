@@ -46,14 +46,6 @@ const App: React.FC = () => {
   const [extractedText, setExtractedText] = useState<string | null>(null);
   const [backendParsed, setBackendParsed] = useState<any>(null);
 
-  const hexToBytes = (hex: string) => {
-    const bytes = new Uint8Array(hex.length / 2);
-    for (let i = 0; i < hex.length; i += 2) {
-      bytes[i / 2] = parseInt(hex.substr(i, 2), 16);
-    }
-    return bytes;
-  };
-
   const handleFileChange = (event: React.ChangeEvent<HTMLInputElement>) => {
     if (event.target.files && event.target.files[0]) {
       setSelectedFile(event.target.files[0]);
@@ -135,12 +127,13 @@ const App: React.FC = () => {
         }),
       });
       
-      const data = await response.json();
-      if (!response.ok) throw new Error(data.detail || 'Certificate generation failed');
+      if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.detail || 'Certificate generation failed');
+      }
       
-      // Convert hex data back to PDF blob using browser-safe code
-      const pdfBytes = hexToBytes(data.pdf_data);
-      const pdfBlob = new Blob([pdfBytes], { type: 'application/pdf' });
+      // The backend returns the PDF as binary application/pdf
+      const pdfBlob = await response.blob();
       const url = URL.createObjectURL(pdfBlob);
       
       // Create a temporary link to trigger the download
@@ -0,0 +1,157 @@
+"""Throughput benchmark for InvoiceParser.parse_invoice_data.
+
+Compares the template engine against the original two-loop parser on large
+synthetic invoice texts and counts where their output differs. Header fields
+should always agree. A few line items may not: the old parser cut the
+description at the first occurrence of the quantity's digits, even when they
+were part of the product code ("CZ-257 ... 2 $233.16" lost its description).
+
+    cd server && python benchmarks/bench_parser.py [--items 50 500 5000] [--repeat 5]
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from typing import Any, Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from invoice_templates import TemplateEngine  # noqa: E402
+
+
+def legacy_parse_invoice_data(text: str) -> Dict[str, Any]:
+    """The original parse_invoice_data, kept verbatim (minus its DEBUG print) as the baseline."""
+    data = {
+        "invoice_number": "", "po_number": "", "date": "", "due_date": "",
+        "vendor_name": "", "total_amount": "", "line_items": [], "raw_text": text
+    }
+    lines = [line.strip() for line in text.split('\n') if line.strip()]
+
+    for i, line in enumerate(lines):
+        line_lower = line.lower()
+        if "bill to ship to" in line_lower and i + 1 < len(lines):
+            customer_line = lines[i+1]
+            customer_parts = customer_line.split()
+            seen = set()
+            unique_customer = []
+            for part in customer_parts:
+                if part not in seen:
+                    unique_customer.append(part)
+                    seen.add(part)
+            data["vendor_name"] = ' '.join(unique_customer)
+        if "invoice details po number:" in line_lower:
+            data["po_number"] = line.split(":")[-1].strip()
+        if "invoice no.:" in line_lower:
+            data["invoice_number"] = line.split(":")[-1].strip()
+        if "invoice date:" in line_lower:
+            data["date"] = line.split(":")[-1].strip()
+        if "due date:" in line_lower:
+            data["due_date"] = line.split(":")[-1].strip()
+        if line_lower.startswith("total"):
+            data["total_amount"] = line.split()[-1]
+
+    in_item_section = False
+    for line in lines:
+        if "product or service" in line.lower() and "qty" in line.lower():
+            in_item_section = True
+            continue
+        if not in_item_section or line.lower().startswith("total") or line.lower().startswith("thank"):
+            continue
+
+        if re.match(r"^\d+\.\s", line):
+            line_wo_num = re.sub(r"^\d+\.\s*", "", line)
+            rate_match = re.search(r"\$([\d,\.]+)", line_wo_num)
+            rate = rate_match.group(1) if rate_match else ''
+            qty = ''
+            if rate_match:
+                before_rate = line_wo_num[:rate_match.start()]
+                qty_candidates = re.findall(r"\b\d{1,6}\b", before_rate)
+                if qty_candidates:
+                    qty = qty_candidates[-1]
+            code_match = re.match(r"([^ ,]+)", line_wo_num)
+            product_code = code_match.group(1).strip() if code_match else ''
+            desc_start = len(product_code)
+            desc_end = line_wo_num.find(qty) if qty else len(line_wo_num)
+            description = line_wo_num[desc_start:desc_end].strip()
+            data["line_items"].append({
+                "product_code": product_code,
+                "description": description,
+                "quantity": qty,
+                "rate": rate,
+                "amount": ''
+            })
+        elif data["line_items"]:
+            data["line_items"][-1]["description"] += f" {line.strip()}"
+    return data
+
+
+WORDS = ["Resistor", "Capacitor", "Ceramic", "SMD", "Connector", "Header", "Cable", "Assembly",
+         "Shielded", "Rev", "Kit", "Module", "Bracket", "Steel", "Black", "Blue", "Pack"]
+
+
+def synthetic_invoice_text(n_items: int, seed: int = 0) -> str:
+    """Deterministic text in the default layout with ``n_items`` line items."""
+    rng = random.Random(seed)
+    lines = [
+        "Amid Technologies Inc",
+        "123 Industrial Way, Springfield",
+        f"Invoice details PO Number: PO-{rng.randint(1000, 9999)}",
+        f"Invoice no.: {rng.randint(10000, 99999)}",
+        "Terms: Net 30",
+        "Invoice date: 01/15/2024",
+        "Due date: 02/14/2024",
+        "Bill to Ship to",
+        "Acme Corp Acme Corp",
+        "500 Main Street 500 Main Street",
+        "# Product or service Description Qty Rate Amount",
+    ]
+    total = 0.0
+    for i in range(1, n_items + 1):
+        code = f"{rng.choice('ABCDEFGH')}{rng.choice('XYZ')}-{rng.randint(100, 999)}"
+        description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6)))
+        qty = rng.randint(1, 5000)
+        rate = rng.randint(1, 50000) / 100
+        total += qty * rate
+        lines.append(f"{i}. {code} {description} {qty} ${rate:,.2f} ${qty * rate:,.2f}")
+        if rng.random() < 0.2:
+            lines.append(" ".join(rng.choice(WORDS) for _ in range(3)))
+    lines += [f"Total ${total:,.2f}", "Thank you for your business!"]
+    return "\n".join(lines)
+
+
+def _best_of(fn, text: str, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(text)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[50, 500, 5000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = TemplateEngine()
+    print(f"{'items':>7} {'lines':>7} {'legacy ms':>10} {'engine ms':>10} {'speedup':>8} "
+          f"{'header diff':>12} {'item diff':>10}")
+    for n_items in args.items:
+        text = synthetic_invoice_text(n_items, seed=n_items)
+        expected = legacy_parse_invoice_data(text)
+        actual = engine.parse(text)
+        actual.pop("template")
+        header_diff = sum(actual[f] != expected[f] for f in expected if f != "line_items")
+        item_diff = sum(a != b for a, b in zip(actual["line_items"], expected["line_items"]))
+        item_diff += abs(len(actual["line_items"]) - len(expected["line_items"]))
+        legacy_s = _best_of(legacy_parse_invoice_data, text, args.repeat)
+        engine_s = _best_of(engine.parse, text, args.repeat)
+        print(f"{n_items:>7} {text.count(chr(10)) + 1:>7} {legacy_s * 1000:>10.2f} {engine_s * 1000:>10.2f} "
+              f"{legacy_s / engine_s:>7.2f}x {header_diff:>12} {item_diff:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""End-to-end benchmark of invoice extraction and certificate generation.
+
+Runs against a deterministic synthetic corpus (see corpus.py) and measures:
+
+* per-stage and end-to-end extraction latency for every document, by
+  calling the pipeline in-process
+* throughput and latency of ``POST /upload`` under concurrent load, against
+  the FastAPI app in-process (result cache disabled)
+* OCR time and accuracy of each image preprocessing path (OCR_PREPROCESS)
+  on the documents that need OCR
+* certificate rendering time for 1-500 line items
+* peak RSS of the benchmark process and of its worker processes
+* parse accuracy against the corpus ground truth
+
+Results are written as JSON. ``--compare`` checks them against an earlier
+run and exits with status 1 when a metric regressed by more than
+``--threshold`` (any accuracy drop counts).
+
+    cd server && python benchmarks/bench_pipeline.py --profile quick --out bench.json
+    cd server && python benchmarks/bench_pipeline.py --compare bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Benchmark extraction itself, not the cache; keep job state, stored invoices and logs out of the way
+os.environ.setdefault("RESULT_CACHE_ENABLED", "0")
+os.environ.setdefault("JOB_DIR", tempfile.mkdtemp(prefix="bench-jobs-"))
+os.environ.setdefault("INVOICE_DB_PATH", os.path.join(tempfile.mkdtemp(prefix="bench-invoices-"), "invoices.sqlite3"))
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+from certificate_template import build_certificate_pdf  # noqa: E402
+from corpus import PROFILES, build_corpus, corpus_fingerprint, make_invoice  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HEADER_FIELDS = ("invoice_number", "po_number", "date", "due_date", "vendor_name", "total_amount")
+CERTIFICATE_ITEMS = (1, 10, 100, 500)
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def peak_rss_mb() -> Dict[str, Optional[float]]:
+    """Peak resident set size so far, of this process and of its (finished) children."""
+    if resource is None:
+        return {"self": None, "children": None}
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    unit = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / unit, 1),
+        "children": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / unit, 1),
+    }
+
+
+def score(expected: Dict[str, Any], actual: Dict[str, Any]) -> Dict[str, int]:
+    """Header fields parsed correctly and line items matched exactly."""
+    def item_key(item):
+        return (item.get("product_code"), item.get("description"), item.get("quantity"), item.get("rate"))
+
+    expected_items = Counter(item_key(item) for item in expected["line_items"])
+    found_items = Counter(item_key(item) for item in actual.get("line_items", []))
+    return {
+        "fields_correct": sum(actual.get(f, "") == expected[f] for f in HEADER_FIELDS),
+        "fields_total": len(HEADER_FIELDS),
+        "items_expected": sum(expected_items.values()),
+        "items_found": sum(found_items.values()),
+        "items_matched": sum((expected_items & found_items).values()),
+    }
+
+
+def bench_documents(corpus_dir: str, documents: List[Dict[str, Any]], repeat: int,
+                    preprocess: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Extract every document in-process ``repeat`` times; report median stage timings and accuracy."""
+    results = []
+    for doc in documents:
+        path = os.path.join(corpus_dir, doc["file"])
+        is_pdf = doc["file"].endswith(".pdf")
+        totals, stages, invoice_data = [], {}, None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            invoice_data, durations = main.run_extraction_timed(path, is_pdf, preprocess)
+            totals.append(time.perf_counter() - start)
+            for stage, seconds in durations.items():
+                stages.setdefault(stage, []).append(seconds)
+        results.append({
+            "file": doc["file"],
+            "format": doc["format"],
+            "pages": doc["pages"],
+            "items": doc["items"],
+            "total_ms": round(statistics.median(totals) * 1000, 2),
+            "stages_ms": {stage: round(statistics.median(v) * 1000, 2) for stage, v in stages.items()},
+            "methods": dict(Counter(p["method"] for p in invoice_data["extraction"]["pages"])),
+            "accuracy": score(doc["expected"], invoice_data),
+        })
+        print(f"  {doc['file']:<28} {results[-1]['total_ms']:>10.1f} ms")
+    return results
+
+
+def bench_preprocess(corpus_dir: str, documents: List[Dict[str, Any]], modes: List[str],
+                     repeat: int) -> Dict[str, Dict[str, Any]]:
+    """Extract the documents that need OCR with each preprocessing path."""
+    ocr_documents = [doc for doc in documents if doc["format"] != "text_pdf"]
+    results = {}
+    for mode in modes:
+        print(f"  {mode}")
+        docs = bench_documents(corpus_dir, ocr_documents, repeat, mode)
+        results[mode] = {
+            "preprocess_ms": round(sum(doc["stages_ms"].get("preprocess", 0) for doc in docs), 2),
+            "ocr_ms": round(sum(doc["stages_ms"].get("ocr", 0) for doc in docs), 2),
+            "total_ms": round(sum(doc["total_ms"] for doc in docs), 2),
+            "accuracy": accuracy_by_format(docs),
+            "documents": docs,
+        }
+    return results
+
+
+async def _load(app, files: List[Dict[str, Any]], concurrency: int, requests: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench",
+                                 timeout=None) as client:
+        async def one(i: int):
+            doc = files[i % len(files)]
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/upload", files={"file": (doc["file"], doc["content"])})
+                latencies.append(time.perf_counter() - start)
+                statuses[response.status_code] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": requests - statuses.get(200, 0),
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(requests / wall, 3),
+        "latency_ms": {
+            "p50": round(_percentile(latencies, 50) * 1000, 1),
+            "p95": round(_percentile(latencies, 95) * 1000, 1),
+            "max": round(max(latencies) * 1000, 1),
+        },
+    }
+
+
+def bench_load(corpus_dir: str, documents: List[Dict[str, Any]], levels: List[int], max_pages: int,
+               rounds: int) -> List[Dict[str, Any]]:
+    """Concurrent POST /upload requests at each concurrency level."""
+    files = []
+    for doc in documents:
+        if doc["pages"] <= max_pages:
+            with open(os.path.join(corpus_dir, doc["file"]), "rb") as f:
+                files.append({"file": doc["file"], "content": f.read()})
+    results = []
+    for level in levels:
+        result = asyncio.run(_load(main.app, files, level, max(level, len(files)) * rounds))
+        print(f"  concurrency {level:>3}: {result['throughput_rps']:>8.2f} req/s, "
+              f"p95 {result['latency_ms']['p95']:.1f} ms, {result['errors']} errors")
+        results.append(result)
+    return results
+
+
+def bench_certificates(repeat: int) -> List[Dict[str, Any]]:
+    """Time build_certificate_pdf for invoices of increasing size."""
+    results = []
+    for n_items in CERTIFICATE_ITEMS:
+        invoice = make_invoice(n_items, n_items)
+        # The certificate payload the client sends: items with numeric quantities
+        invoice["items"] = [
+            {"product_code": item["product_code"], "description": item["description"],
+             "qty": int(item["quantity"]), "date_code": "2024-01"}
+            for item in invoice.pop("line_items")
+        ]
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            pdf_bytes = build_certificate_pdf(invoice)
+            timings.append(time.perf_counter() - start)
+        results.append({"items": n_items, "median_ms": round(statistics.median(timings) * 1000, 2),
+                        "bytes": len(pdf_bytes)})
+        print(f"  {n_items:>4} items: {results[-1]['median_ms']:>8.1f} ms")
+    return results
+
+
+def accuracy_by_format(documents: List[Dict[str, Any]]) -> Dict[str, Dict[str, float]]:
+    totals: Dict[str, Counter] = {}
+    for doc in documents:
+        totals.setdefault(doc["format"], Counter()).update(doc["accuracy"])
+    return {
+        fmt: {
+            "fields": round(t["fields_correct"] / t["fields_total"], 4),
+            "items_recall": round(t["items_matched"] / t["items_expected"], 4) if t["items_expected"] else 1.0,
+            "items_precision": round(t["items_matched"] / t["items_found"], 4) if t["items_found"] else 0.0,
+        }
+        for fmt, t in sorted(totals.items())
+    }
+
+
+def summarize(results: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Flat ``{metric: {"value", "better"}}`` view used by --compare."""
+    summary: Dict[str, Dict[str, Any]] = {}
+
+    def add(name, value, better):
+        if value is not None:
+            summary[name] = {"value": value, "better": better}
+
+    for doc in results["documents"]:
+        add(f"extract.{doc['file']}.total_ms", doc["total_ms"], "lower")
+        for stage, ms in doc["stages_ms"].items():
+            add(f"extract.{doc['file']}.{stage}_ms", ms, "lower")
+    for level in results["load"]:
+        add(f"load.c{level['concurrency']}.throughput_rps", level["throughput_rps"], "higher")
+        add(f"load.c{level['concurrency']}.p95_ms", level["latency_ms"]["p95"], "lower")
+    for mode, result in results["preprocess"].items():
+        for name in ("preprocess_ms", "ocr_ms", "total_ms"):
+            add(f"preprocess.{mode}.{name}", result[name], "lower")
+        for fmt, scores in result["accuracy"].items():
+            for name, value in scores.items():
+                add(f"preprocess.{mode}.accuracy.{fmt}.{name}", value, "higher")
+    for cert in results["certificates"]:
+        add(f"certificate.{cert['items']}_items_ms", cert["median_ms"], "lower")
+    for fmt, scores in results["accuracy"].items():
+        for name, value in scores.items():
+            add(f"accuracy.{fmt}.{name}", value, "higher")
+    add("peak_rss_mb.self", results["peak_rss_mb"]["self"], "lower")
+    add("peak_rss_mb.children", results["peak_rss_mb"]["children"], "lower")
+    return summary
+
+
+def compare(current: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float,
+            min_ms: float) -> List[Dict[str, Any]]:
+    """Metrics that got worse than the baseline by more than ``threshold`` (relative)."""
+    regressions = []
+    for name, metric in sorted(current.items()):
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["value"], metric["value"]
+        worse = new - old if metric["better"] == "lower" else old - new
+        if name.startswith("accuracy.") or ".accuracy." in name:
+            regressed = worse > 1e-9
+        elif name.endswith("_ms") and worse < min_ms:
+            # Differences of a millisecond or two are timer noise
+            regressed = False
+        else:
+            regressed = old > 0 and worse / old > threshold
+        if regressed:
+            change = (new - old) / old * 100 if old else float("inf")
+            regressions.append({"metric": name, "baseline": old, "current": new, "change_pct": round(change, 1)})
+    return regressions
+
+
+def metadata() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=SERVER_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "extraction_executor": main.EXTRACTION_EXECUTOR,
+        "extraction_workers": main.EXTRACTION_WORKERS,
+        "config": main.extraction_config(main.ocr_engine_info()),
+        "ocr_engine": main.ocr_engine_info(),
+        "ocr_preprocessor": main.get_ocr_preprocessor().config,
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--corpus-dir", default=None, help="default: benchmarks/corpus/<profile>")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per document/certificate (median is kept)")
+    parser.add_argument("--preprocess", nargs="+", default=["standard", "fast"],
+                        help="OCR preprocessing paths to compare (see OCR_PREPROCESS)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--load-max-pages", type=int, default=5, help="largest document used for the load test")
+    parser.add_argument("--load-rounds", type=int, default=2, help="passes over the load documents per level")
+    parser.add_argument("--out", default=None, help="write results JSON here")
+    parser.add_argument("--compare", default=None, help="baseline results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.15, help="relative change counted as a regression")
+    parser.add_argument("--min-ms", type=float, default=2.0, help="ignore timing changes smaller than this")
+    args = parser.parse_args()
+
+    corpus_dir = os.path.abspath(args.corpus_dir or os.path.join(SERVER_DIR, "benchmarks", "corpus", args.profile))
+    out_path = os.path.abspath(args.out) if args.out else None
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    print(f"Building corpus in {corpus_dir}")
+    manifest = build_corpus(corpus_dir, args.profile, args.seed)
+
+    # /upload writes temporary files under ./uploads
+    os.chdir(tempfile.mkdtemp(prefix="bench-"))
+    results: Dict[str, Any] = {
+        "meta": metadata(),
+        "corpus": {"profile": args.profile, "seed": args.seed, "fingerprint": corpus_fingerprint(manifest),
+                   "documents": len(manifest["documents"])},
+        "rss_by_phase_mb": {},
+    }
+    try:
+        print("Per-document extraction (in-process)")
+        results["documents"] = bench_documents(corpus_dir, manifest["documents"], args.repeat)
+        results["rss_by_phase_mb"]["documents"] = peak_rss_mb()
+        print("OCR preprocessing paths")
+        results["preprocess"] = bench_preprocess(corpus_dir, manifest["documents"], args.preprocess, args.repeat)
+        print("Concurrent /upload load")
+        results["load"] = bench_load(corpus_dir, manifest["documents"], args.concurrency, args.load_max_pages,
+                                     args.load_rounds)
+        results["rss_by_phase_mb"]["load"] = peak_rss_mb()
+        print("Certificate rendering")
+        results["certificates"] = bench_certificates(args.repeat)
+        results["rss_by_phase_mb"]["certificates"] = peak_rss_mb()
+    finally:
+        main.extraction_executor.shutdown()
+    results["peak_rss_mb"] = peak_rss_mb()
+    results["accuracy"] = accuracy_by_format(results["documents"])
+    results["summary"] = summarize(results)
+
+    print("Accuracy")
+    for fmt, scores in results["accuracy"].items():
+        print(f"  {fmt:<10} fields {scores['fields']:.0%}  items recall {scores['items_recall']:.0%}  "
+              f"precision {scores['items_precision']:.0%}")
+    print("OCR preprocessing")
+    for mode, result in results["preprocess"].items():
+        print(f"  {mode:<10} preprocess {result['preprocess_ms']:.1f} ms  OCR {result['ocr_ms']:.1f} ms  "
+              f"total {result['total_ms']:.1f} ms")
+        for fmt, scores in result["accuracy"].items():
+            print(f"    {fmt:<10} fields {scores['fields']:.0%}  items recall {scores['items_recall']:.0%}  "
+                  f"precision {scores['items_precision']:.0%}")
+    print(f"Peak RSS: {results['peak_rss_mb']['self']} MB (workers {results['peak_rss_mb']['children']} MB)")
+
+    exit_code = 0
+    if compare_path:
+        with open(compare_path) as f:
+            baseline = json.load(f)
+        if baseline.get("corpus", {}).get("fingerprint") != results["corpus"]["fingerprint"]:
+            print("Warning: the baseline was run on a different corpus")
+        regressions = compare(results["summary"], baseline["summary"], args.threshold, args.min_ms)
+        results["regressions"] = regressions
+        if regressions:
+            exit_code = 1
+            print(f"{len(regressions)} regressions against {compare_path}:")
+            for r in regressions:
+                print(f"  {r['metric']:<60} {r['baseline']:>10} -> {r['current']:>10} ({r['change_pct']:+.1f}%)")
+        else:
+            print(f"No regressions against {compare_path}")
+
+    if out_path:
+        with open(out_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {out_path}")
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main_cli()
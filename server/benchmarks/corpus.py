@@ -0,0 +1,216 @@
+"""Deterministic synthetic invoice corpus for the benchmarks.
+
+Every document is generated locally from a seed, so two runs of the same
+profile produce the same invoices and the same ground truth:
+
+* ``text_pdf``: a ReportLab PDF with a real text layer
+* ``scan_pdf``: the same pages rendered to noisy grayscale images and saved
+  as an image-only PDF, so every page needs OCR
+* ``png`` / ``jpeg``: a single page photographed slightly askew
+
+Invoices use the default template's layout, and ``manifest.json`` records
+the header fields and line items the parser is expected to return.
+
+    cd server && python benchmarks/corpus.py --profile quick --out benchmarks/corpus/quick
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+import reportlab
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+from reportlab.lib.pagesizes import letter
+from reportlab.pdfgen import canvas
+
+CORPUS_VERSION = "1"
+
+# (pages, line items) variants and the formats each is generated in
+PROFILES: Dict[str, List[Tuple[int, int, Tuple[str, ...]]]] = {
+    "quick": [
+        (1, 1, ("text_pdf", "scan_pdf", "png", "jpeg")),
+        (1, 10, ("text_pdf", "scan_pdf", "png")),
+        (5, 100, ("text_pdf", "scan_pdf")),
+    ],
+    "full": [
+        (1, 1, ("text_pdf", "scan_pdf", "png", "jpeg")),
+        (1, 10, ("text_pdf", "scan_pdf", "png", "jpeg")),
+        (1, 35, ("text_pdf", "scan_pdf", "png", "jpeg")),
+        (5, 100, ("text_pdf", "scan_pdf")),
+        (20, 250, ("text_pdf", "scan_pdf")),
+        (50, 500, ("text_pdf", "scan_pdf")),
+    ],
+}
+
+WORDS = ["Resistor", "Capacitor", "Ceramic", "SMD", "Connector", "Header", "Cable", "Assembly",
+         "Shielded", "Kit", "Module", "Bracket", "Steel", "Black", "Blue", "Pack", "Fuse", "Relay"]
+CUSTOMERS = ["Acme Corp", "Globex Industries", "Initech Systems", "Umbrella Components", "Stark Supply"]
+
+PAGE_WIDTH, PAGE_HEIGHT = letter
+MARGIN = 54
+FONT_SIZE = 10
+LINE_HEIGHT = 14
+SCAN_DPI = 200
+FIXED_DATE = time.gmtime(1704067200)  # 2024-01-01
+FONT_PATH = os.path.join(os.path.dirname(reportlab.__file__), "fonts", "Vera.ttf")
+
+
+def make_invoice(seed: int, n_items: int) -> Dict[str, Any]:
+    """Ground truth for one invoice, in the shape parse_invoice_data returns."""
+    rng = random.Random(seed)
+    customer = rng.choice(CUSTOMERS)
+    items = []
+    total = 0.0
+    for _ in range(n_items):
+        quantity = rng.randint(1, 5000)
+        rate = rng.randint(1, 50000) / 100
+        total += quantity * rate
+        items.append({
+            "product_code": f"{rng.choice('ABCDEFGH')}{rng.choice('XYZ')}-{rng.randint(100, 999)}",
+            "description": " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))),
+            "quantity": str(quantity),
+            "rate": f"{rate:,.2f}",
+            "amount": f"{quantity * rate:,.2f}",
+        })
+    return {
+        "invoice_number": str(rng.randint(10000, 99999)),
+        "po_number": f"PO-{rng.randint(1000, 9999)}",
+        "date": f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2024",
+        "due_date": f"{rng.randint(1, 12):02d}/{rng.randint(1, 28):02d}/2025",
+        "vendor_name": customer,
+        "total_amount": f"${total:,.2f}",
+        "line_items": items,
+    }
+
+
+def invoice_pages(invoice: Dict[str, Any], n_pages: int) -> List[List[str]]:
+    """Lay the invoice out as text lines, spreading the items over ``n_pages`` pages."""
+    header = [
+        "Amid Technologies Inc",
+        "123 Industrial Way, Springfield",
+        f"Invoice details PO Number: {invoice['po_number']}",
+        f"Invoice no.: {invoice['invoice_number']}",
+        "Terms: Net 30",
+        f"Invoice date: {invoice['date']}",
+        f"Due date: {invoice['due_date']}",
+        "Bill to Ship to",
+        f"{invoice['vendor_name']} {invoice['vendor_name']}",
+        "# Product or service Description Qty Rate Amount",
+    ]
+    rows = [
+        f"{i}. {item['product_code']} {item['description']} {item['quantity']} ${item['rate']} ${item['amount']}"
+        for i, item in enumerate(invoice["line_items"], start=1)
+    ]
+    per_page = -(-len(rows) // n_pages) if rows else 0
+    pages = [rows[p * per_page:(p + 1) * per_page] for p in range(n_pages)]
+    pages[0] = header + pages[0]
+    pages[-1] = pages[-1] + [f"Total {invoice['total_amount']}", "Thank you for your business!"]
+    return pages
+
+
+def write_text_pdf(path: str, pages: Sequence[Sequence[str]]):
+    pdf = canvas.Canvas(path, pagesize=letter, invariant=1)
+    for lines in pages:
+        pdf.setFont("Helvetica", FONT_SIZE)
+        y = PAGE_HEIGHT - MARGIN
+        for line in lines:
+            pdf.drawString(MARGIN, y, line)
+            y -= LINE_HEIGHT
+        pdf.showPage()
+    pdf.save()
+
+
+def render_page(lines: Sequence[str], seed: int, dpi: int = SCAN_DPI) -> Image.Image:
+    """Render one page of text as a slightly noisy grayscale scan."""
+    scale = dpi / 72
+    image = Image.new("L", (int(PAGE_WIDTH * scale), int(PAGE_HEIGHT * scale)), 255)
+    draw = ImageDraw.Draw(image)
+    font = ImageFont.truetype(FONT_PATH, int(FONT_SIZE * scale))
+    y = MARGIN * scale
+    for line in lines:
+        draw.text((MARGIN * scale, y), line, fill=0, font=font)
+        y += LINE_HEIGHT * scale
+    noise = np.random.default_rng(seed).normal(0, 12, (image.height, image.width))
+    pixels = np.clip(np.asarray(image, dtype=np.float32) + noise, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels).filter(ImageFilter.GaussianBlur(0.6))
+
+
+def write_scan_pdf(path: str, pages: Sequence[Sequence[str]], seed: int):
+    images = [render_page(lines, seed + i) for i, lines in enumerate(pages)]
+    # Fixed dates keep the file byte-for-byte reproducible
+    images[0].save(path, "PDF", save_all=True, append_images=images[1:], resolution=SCAN_DPI,
+                   creationDate=FIXED_DATE, modDate=FIXED_DATE)
+
+
+def write_photo(path: str, lines: Sequence[str], seed: int, fmt: str):
+    """A page photographed on a grey desk: small rotation, uneven background."""
+    page = render_page(lines, seed)
+    rotated = page.rotate(random.Random(seed).uniform(-1.5, 1.5), resample=Image.BICUBIC,
+                          expand=True, fillcolor=150)
+    rotated.save(path, fmt.upper(), **({"quality": 85} if fmt == "jpeg" else {}))
+
+
+def build_corpus(out_dir: str, profile: str = "quick", seed: int = 0) -> Dict[str, Any]:
+    """Generate a profile's documents into ``out_dir`` and return the manifest.
+
+    An existing corpus with the same profile, seed and CORPUS_VERSION is
+    reused as is.
+    """
+    manifest_path = os.path.join(out_dir, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if (manifest.get("profile"), manifest.get("seed"), manifest.get("version")) == (profile, seed, CORPUS_VERSION):
+            return manifest
+
+    os.makedirs(out_dir, exist_ok=True)
+    documents = []
+    for variant, (n_pages, n_items, formats) in enumerate(PROFILES[profile]):
+        doc_seed = seed * 1000 + variant
+        invoice = make_invoice(doc_seed, n_items)
+        pages = invoice_pages(invoice, n_pages)
+        for fmt in formats:
+            ext = {"text_pdf": "pdf", "scan_pdf": "pdf"}.get(fmt, fmt)
+            name = f"{fmt}_{n_pages}p_{n_items}i.{ext}"
+            path = os.path.join(out_dir, name)
+            if fmt == "text_pdf":
+                write_text_pdf(path, pages)
+            elif fmt == "scan_pdf":
+                write_scan_pdf(path, pages, doc_seed)
+            else:
+                # Photos are single page
+                write_photo(path, [line for page in pages for line in page], doc_seed, fmt)
+            with open(path, "rb") as f:
+                digest = hashlib.sha256(f.read()).hexdigest()
+            documents.append({"file": name, "format": fmt, "pages": n_pages if fmt.endswith("pdf") else 1,
+                              "items": n_items, "sha256": digest, "expected": invoice})
+
+    manifest = {"version": CORPUS_VERSION, "profile": profile, "seed": seed, "documents": documents}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def corpus_fingerprint(manifest: Dict[str, Any]) -> str:
+    """Short hash of the documents, to tell whether two runs used the same corpus."""
+    digests = "".join(doc["sha256"] for doc in manifest["documents"])
+    return hashlib.sha256(digests.encode()).hexdigest()[:16]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="quick")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="output directory (default: benchmarks/corpus/<profile>)")
+    args = parser.parse_args()
+    out_dir = args.out or os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus", args.profile)
+    manifest = build_corpus(out_dir, args.profile, args.seed)
+    print(f"{len(manifest['documents'])} documents in {out_dir} (corpus {corpus_fingerprint(manifest)})")
+
+
+if __name__ == "__main__":
+    main()
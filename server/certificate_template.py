@@ -0,0 +1,330 @@
+"""Certificate of Compliance rendering.
+
+Everything on a certificate that doesn't depend on the invoice is built once
+per CertificateTemplate and reused for every certificate: the paragraph and
+table styles, the certification paragraph, the signature block and the
+encoded logo image. Only the per-invoice fields and the line-item table are
+built for each request. Templates are cached per (company, signer, logo).
+"""
+import copy
+import functools
+import hashlib
+import io
+import os
+from datetime import datetime
+from xml.sax.saxutils import escape
+from typing import Any, Dict, List, Optional, Tuple
+
+from PIL import Image as PILImage
+from reportlab.lib import colors
+from reportlab.lib.enums import TA_CENTER
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.pdfbase.pdfdoc import PDFImageXObject
+from reportlab.platypus import KeepTogether, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+from reportlab.platypus.flowables import Flowable
+
+DEFAULT_COMPANY_NAME = "Amid Technologies Inc"
+DEFAULT_SIGNER_NAME = "Dima Minin"
+DEFAULT_LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'amid-logo.jpeg')
+CERTIFICATION_TEXT_TEMPLATE = (
+    "We certify that all materials, and products listed below have been assembled, produced, "
+    "inspected, and tested in full accordance with all applicable specifications, drawings, and "
+    "other purchase requirements. Test reports and/or suitable evidence of compliance are on file "
+    "and are available from the manufacturer. "
+    "{company} has established a known chain of custody for the material originating from the OEM."
+)
+CERTIFICATION_TEXT = CERTIFICATION_TEXT_TEMPLATE.format(company="Amid Technologies")
+
+LEFT_MARGIN = 0.5*inch
+RIGHT_MARGIN = 0.75*inch
+MAX_LOGO_WIDTH = 1.2*inch
+MAX_LOGO_HEIGHT = 1.0*inch
+
+
+class CachedImage(Flowable):
+    """Image flowable whose PDF image object is encoded once and shared by every document.
+
+    ReportLab's Image flowable reads and ASCII85-encodes the file again for
+    every document it is drawn into; this registers a copy of a prebuilt
+    PDFImageXObject instead.
+    """
+
+    def __init__(self, xobject: PDFImageXObject, width: float, height: float):
+        Flowable.__init__(self)
+        self.xobject = xobject
+        self.width = width
+        self.height = height
+
+    def wrap(self, availWidth, availHeight):
+        return self.width, self.height
+
+    def draw(self):
+        canv = self.canv
+        doc = canv._doc
+        reg_name = doc.getXObjectName(self.xobject.name)
+        if reg_name not in doc.idToObject:
+            # Same registration canvas.drawImage does for a new image
+            xobject = copy.copy(self.xobject)
+            canv._setXObjects(xobject)
+            doc.Reference(xobject, reg_name)
+            doc.addForm(xobject.name, xobject)
+        canv._currentPageHasImages = 1
+        canv.saveState()
+        canv.scale(self.width, self.height)
+        canv.doForm(self.xobject.name)
+        canv.restoreState()
+
+
+def shipping_date_from(due_date: str) -> str:
+    """Month and year of the due date, or N/A if it can't be parsed."""
+    if not due_date:
+        return "N/A"
+    # Handle common date formats
+    for fmt in ['%m/%d/%Y', '%Y-%m-%d', '%m-%d-%Y', '%d/%m/%Y']:
+        try:
+            return datetime.strptime(due_date, fmt).strftime('%B %Y')
+        except (ValueError, TypeError):
+            continue
+    return "N/A"
+
+
+def certification_text_for(company_name: str) -> str:
+    """The certification paragraph, naming the company that certifies the chain of custody."""
+    if company_name == DEFAULT_COMPANY_NAME:
+        return CERTIFICATION_TEXT
+    return CERTIFICATION_TEXT_TEMPLATE.format(company=escape(company_name))
+
+
+class CertificateTemplate:
+    """Static parts of the certificates of one company.
+
+    ``logo_path`` and ``certification_text`` default to the Amid logo and
+    text for the default company; another company gets its own name in the
+    certification text and no logo unless one is given.
+    """
+
+    def __init__(self, company_name: str = DEFAULT_COMPANY_NAME, signer_name: str = DEFAULT_SIGNER_NAME,
+                 logo_path: Optional[str] = None, certification_text: Optional[str] = None):
+        if logo_path is None and company_name == DEFAULT_COMPANY_NAME:
+            logo_path = DEFAULT_LOGO_PATH
+        if certification_text is None:
+            certification_text = certification_text_for(company_name)
+        self.company_name = company_name
+        self.signer_name = signer_name
+        self.logo_path = logo_path
+
+        styles = getSampleStyleSheet()
+        self.normal_style = styles['Normal']
+        self.header_right_style = ParagraphStyle(name='HeaderRight', parent=styles['Normal'], alignment=TA_CENTER, fontSize=14, leading=16)
+        self.details_style = ParagraphStyle(name='DetailsStyle', parent=styles['Normal'], spaceAfter=6)
+        self.body_style = ParagraphStyle(name='BodyStyle', parent=styles['Normal'], spaceAfter=12)
+        self.signature_style = ParagraphStyle(name='SignatureStyle', parent=styles['Normal'], alignment=TA_CENTER, spaceAfter=0, spaceBefore=0, leading=10)
+
+        # --- 0. Logo, scaled proportionally and encoded once ---
+        self.logo_xobject: Optional[PDFImageXObject] = None
+        if logo_path and os.path.exists(logo_path):
+            with PILImage.open(logo_path) as pil_img:
+                w, h = pil_img.size
+            aspect = w / h
+            self.logo_width = min(MAX_LOGO_WIDTH, MAX_LOGO_HEIGHT * aspect)
+            self.logo_height = self.logo_width / aspect
+            if self.logo_height > MAX_LOGO_HEIGHT:
+                self.logo_height = MAX_LOGO_HEIGHT
+                self.logo_width = self.logo_height * aspect
+            logo_name = "logo-" + hashlib.md5(os.path.abspath(logo_path).encode("utf-8")).hexdigest()[:12]
+            self.logo_xobject = PDFImageXObject(logo_name, logo_path)
+        else:
+            self.logo_width = MAX_LOGO_WIDTH
+            self.logo_height = MAX_LOGO_HEIGHT
+
+        printable_width = letter[0] - LEFT_MARGIN - RIGHT_MARGIN
+        self.header_col_widths = [self.logo_width, printable_width - 2 * self.logo_width, self.logo_width]
+        self.header_table_style = TableStyle([
+            ('VALIGN', (0, 0), (0, 0), 'TOP'),
+            ('VALIGN', (1, 0), (1, 0), 'TOP'),
+            ('VALIGN', (2, 0), (2, 0), 'TOP'),
+            ('ALIGN', (1, 0), (1, 0), 'CENTER'),
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+            ('TOPPADDING', (0, 0), (-1, -1), 0),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+        ])
+
+        # Parsed paragraphs are shared; each certificate lays out its own copies
+        self.certification_para = Paragraph(certification_text, self.body_style)
+        self.product_header_paras = [
+            Paragraph('<b>Product Code</b>', self.normal_style),
+            Paragraph('<b>Description</b>', self.normal_style),
+            Paragraph('<b>Quantity</b>', self.normal_style),
+            Paragraph('<b>Date Code</b>', self.normal_style),
+        ]
+        self.product_table_style = TableStyle([
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (2, 1), (2, -1), 'RIGHT'),
+            ('ALIGN', (0, 1), (1, -1), 'LEFT'),
+            ('ALIGN', (3, 1), (3, -1), 'LEFT'),
+            ('TOPPADDING', (0, 0), (-1, -1), 4),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
+            ('LEFTPADDING', (0, 0), (-1, -1), 6),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
+            ('BOX', (0, 0), (-1, -1), 1, colors.black),
+            ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.black),
+        ])
+
+        # --- 5. Signature Block ---
+        self.signature_paras = [
+            Paragraph(escape(signer_name), self.signature_style),
+            Paragraph("____________________________", self.signature_style),
+            Paragraph(escape(company_name), self.signature_style),
+            Paragraph("<b>Manufacturer's Representative</b>", self.signature_style),
+        ]
+        self.signature_table_style = TableStyle([
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
+            ('TOPPADDING', (0, 0), (0, 0), 0),
+            ('BOTTOMPADDING', (0, 0), (0, 0), 0),
+            ('TOPPADDING', (0, 1), (0, 1), 0),
+            ('BOTTOMPADDING', (0, 1), (0, 1), 0),
+            ('TOPPADDING', (0, 2), (0, 2), 6),
+            ('BOTTOMPADDING', (0, 2), (0, 2), 0),
+            ('TOPPADDING', (0, 3), (0, 3), 0),
+            ('BOTTOMPADDING', (0, 3), (0, 3), 0),
+            ('LEFTPADDING', (0, 0), (-1, -1), 0),
+            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ])
+
+    def _logo(self) -> Flowable:
+        if self.logo_xobject is None:
+            return Spacer(self.logo_width, MAX_LOGO_HEIGHT)
+        return CachedImage(self.logo_xobject, self.logo_width, self.logo_height)
+
+    def render(self, invoice_data: Dict[str, Any]) -> bytes:
+        """Render the certificate for one invoice and return the PDF bytes."""
+        buffer = io.BytesIO()
+        doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=RIGHT_MARGIN, leftMargin=LEFT_MARGIN, topMargin=0.5*inch, bottomMargin=0.5*inch)
+        story: List[Flowable] = []
+
+        # Calculate total quantity from line items
+        total_quantity = 0
+        if invoice_data.get("items"):
+            for item in invoice_data["items"]:
+                try:
+                    qty = float(item.get("qty", 0))
+                    total_quantity += qty
+                except (ValueError, TypeError):
+                    pass
+
+        # Extract shipping date (month and year) from due date
+        shipping_date = shipping_date_from(invoice_data.get('due_date', ''))
+
+        # --- 1. Logo at Top Left, Title/Date Centered on Same Row ---
+        header_right_text = f"<b>Certificate of Compliance</b><br/><b>Date: {invoice_data.get('date', 'N/A')}</b>"
+        header_para_box = [Spacer(1, 0.3*inch), Paragraph(header_right_text, self.header_right_style)]
+        header_table = Table(
+            [[self._logo(), header_para_box, Spacer(self.logo_width, MAX_LOGO_HEIGHT)]],
+            colWidths=self.header_col_widths,
+            hAlign='LEFT'
+        )
+        header_table.setStyle(self.header_table_style)
+        story.append(header_table)
+        story.append(Spacer(1, 0.5*inch))
+
+        # --- 2. Customer and PO Details ---
+        story.append(Paragraph(f"<b>Customer:</b> {invoice_data.get('vendor_name', 'N/A')}", self.details_style))
+        story.append(Paragraph(f"<b>Customer Purchase Order No:</b> {invoice_data.get('po_number', 'N/A')}", self.details_style))
+        story.append(Paragraph(f"<b>Customer Purchase Number:</b> {invoice_data.get('customer_purchase_number', 'N/A')}", self.details_style))
+        story.append(Paragraph(f"<b>Shipping Date:</b> {shipping_date}", self.details_style))
+        story.append(Paragraph(f"<b>Total Quantity:</b> {total_quantity:,.0f}", self.details_style))
+        story.append(Spacer(1, 0.25*inch))
+
+        # --- 3. Certification Text (Part 1) ---
+        story.append(copy.copy(self.certification_para))
+        story.append(Spacer(1, 0.25*inch))
+
+        # --- 4. Line Items Table (Single Table Format) ---
+        product_table_data = [[copy.copy(p) for p in self.product_header_paras]]
+        if invoice_data.get("items"):
+            for item in invoice_data["items"]:
+                product_table_data.append([
+                    Paragraph(item.get("product_code", ""), self.normal_style),
+                    Paragraph(item.get("description", ""), self.normal_style),
+                    Paragraph(f"{item.get('qty', 0):,}", self.normal_style),
+                    Paragraph(item.get("date_code", ""), self.normal_style)
+                ])
+        product_table = Table(product_table_data, colWidths=[2.2*inch, 3.2*inch, 1.0*inch, 1.1*inch], hAlign='LEFT')
+        product_table.setStyle(self.product_table_style)
+        story.append(product_table)
+        story.append(Spacer(1, 0.25*inch))
+
+        # --- 5. Signature Block ---
+        # Use a single table for the signature block to control spacing tightly
+        signature_table = Table([[copy.copy(p)] for p in self.signature_paras],
+                                colWidths=[3*inch], hAlign='CENTER', style=self.signature_table_style)
+        signature_block = [
+            Spacer(1, 0.25*inch),  # Move signature block further down
+            signature_table,
+            Spacer(1, 0.1*inch)
+        ]
+
+        # --- 6. Assemble Story with Conditional KeepTogether ---
+        if len(product_table_data) <= 5:  # 1 header + 4 products
+            story_content = story + signature_block
+            story = [KeepTogether(story_content)]
+        else:
+            story.extend(signature_block)
+
+        doc.build(story)
+        return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=16)
+def get_certificate_template(company_name: str = DEFAULT_COMPANY_NAME, signer_name: str = DEFAULT_SIGNER_NAME,
+                             logo_path: Optional[str] = None) -> CertificateTemplate:
+    """Return the cached template for this company, signer and logo, building it on first use."""
+    return CertificateTemplate(company_name, signer_name, logo_path)
+
+
+def build_certificate_pdf(invoice_data: Dict[str, Any]) -> bytes:
+    """Render a redesigned, professional compliance certificate PDF.
+
+    ``company_name`` and ``signer_name`` in the payload select the template;
+    the defaults are used when they're missing.
+    """
+    template = get_certificate_template(
+        str(invoice_data.get("company_name") or DEFAULT_COMPANY_NAME),
+        str(invoice_data.get("signer_name") or DEFAULT_SIGNER_NAME),
+    )
+    return template.render(invoice_data)
+
+
+def validate_certificate_payload(invoice_data: Any) -> Optional[str]:
+    """Return why a payload can't be rendered, or None if it looks valid."""
+    if not isinstance(invoice_data, dict):
+        return "invoice payload must be a JSON object"
+    items = invoice_data.get("items")
+    if items is not None:
+        if not isinstance(items, list):
+            return "'items' must be a list"
+        for i, item in enumerate(items):
+            if not isinstance(item, dict):
+                return f"items[{i}] must be a JSON object"
+    return None
+
+
+def try_build_certificate_pdf(invoice_data: Any) -> Tuple[Optional[bytes], Optional[str]]:
+    """Render one certificate of a batch, returning ``(pdf_bytes, None)`` or ``(None, error)``.
+
+    Errors are returned rather than raised so one bad payload doesn't fail
+    the whole batch.
+    """
+    error = validate_certificate_payload(invoice_data)
+    if error:
+        return None, error
+    try:
+        return build_certificate_pdf(invoice_data), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
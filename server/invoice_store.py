@@ -0,0 +1,220 @@
+"""Persistent store of parsed invoices in a local SQLite file.
+
+Every successful extraction is saved with its header fields, line items,
+raw text and the SHA-256 of the uploaded file. Uploading the same file again
+updates its record instead of adding another one.
+
+* Header fields used for lookups (``invoice_number``, ``po_number``,
+  ``vendor_name``, both dates) and line item ``product_code`` are indexed.
+* Dates are also stored as ISO ``YYYY-MM-DD`` so they can be range-queried.
+* ``raw_text`` is indexed with FTS5 for full-text search.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    source_sha256 TEXT NOT NULL UNIQUE,
+    filename TEXT,
+    invoice_number TEXT,
+    po_number TEXT,
+    vendor_name TEXT COLLATE NOCASE,
+    invoice_date TEXT,
+    due_date TEXT,
+    total_amount TEXT,
+    data TEXT NOT NULL,
+    raw_text TEXT NOT NULL DEFAULT '',
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS invoices_invoice_number ON invoices (invoice_number);
+CREATE INDEX IF NOT EXISTS invoices_po_number ON invoices (po_number);
+CREATE INDEX IF NOT EXISTS invoices_vendor_name ON invoices (vendor_name);
+CREATE INDEX IF NOT EXISTS invoices_vendor_date ON invoices (vendor_name, invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_invoice_date ON invoices (invoice_date);
+CREATE INDEX IF NOT EXISTS invoices_due_date ON invoices (due_date);
+
+CREATE TABLE IF NOT EXISTS line_items (
+    invoice_id INTEGER NOT NULL REFERENCES invoices (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    product_code TEXT,
+    PRIMARY KEY (invoice_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS line_items_product_code ON line_items (product_code, invoice_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS invoices_fts USING fts5(raw_text, content='invoices', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS invoices_fts_insert AFTER INSERT ON invoices BEGIN
+    INSERT INTO invoices_fts (rowid, raw_text) VALUES (new.id, new.raw_text);
+END;
+CREATE TRIGGER IF NOT EXISTS invoices_fts_delete AFTER DELETE ON invoices BEGIN
+    INSERT INTO invoices_fts (invoices_fts, rowid, raw_text) VALUES ('delete', old.id, old.raw_text);
+END;
+CREATE TRIGGER IF NOT EXISTS invoices_fts_update AFTER UPDATE OF raw_text ON invoices BEGIN
+    INSERT INTO invoices_fts (invoices_fts, rowid, raw_text) VALUES ('delete', old.id, old.raw_text);
+    INSERT INTO invoices_fts (rowid, raw_text) VALUES (new.id, new.raw_text);
+END;
+"""
+
+# Columns returned in lookup and search results; the full record comes from get()
+_SUMMARY_COLUMNS = ("id", "filename", "invoice_number", "po_number", "vendor_name", "invoice_date", "due_date",
+                    "total_amount", "created_at", "updated_at")
+_SUMMARY_SQL = ", ".join(f"invoices.{column}" for column in _SUMMARY_COLUMNS)
+
+DATE_FORMATS = ("%m/%d/%Y", "%m/%d/%y", "%Y-%m-%d", "%m-%d-%Y", "%d.%m.%Y", "%B %d, %Y", "%b %d, %Y")
+
+
+def iso_date(value: Any) -> Optional[str]:
+    """A parsed date as ``YYYY-MM-DD``, or None if it isn't in a known format."""
+    text = str(value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    return None
+
+
+def fts_query(text: str) -> str:
+    """Quote every word so user input is matched literally rather than as FTS5 syntax."""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+class InvoiceStore:
+    """Parsed invoices in a SQLite file, indexed for lookup and full-text search."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL keeps the store consistent without an fsync on every commit
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def save(self, invoice_data: Dict[str, Any], source_sha256: str, filename: str = "") -> int:
+        """Insert or update the invoice parsed from a file, returning its id."""
+        data = {k: v for k, v in invoice_data.items() if k != "raw_text"}
+        items = invoice_data.get("line_items") or []
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                invoice_id = self._conn.execute(
+                    "INSERT INTO invoices (source_sha256, filename, invoice_number, po_number, vendor_name, "
+                    "invoice_date, due_date, total_amount, data, raw_text, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (source_sha256) DO UPDATE SET filename = excluded.filename, "
+                    "invoice_number = excluded.invoice_number, po_number = excluded.po_number, "
+                    "vendor_name = excluded.vendor_name, invoice_date = excluded.invoice_date, "
+                    "due_date = excluded.due_date, total_amount = excluded.total_amount, data = excluded.data, "
+                    "raw_text = excluded.raw_text, updated_at = excluded.updated_at "
+                    "RETURNING id",
+                    (source_sha256, filename, invoice_data.get("invoice_number") or None,
+                     invoice_data.get("po_number") or None, invoice_data.get("vendor_name") or None,
+                     iso_date(invoice_data.get("date")), iso_date(invoice_data.get("due_date")),
+                     invoice_data.get("total_amount") or None, json.dumps(data),
+                     invoice_data.get("raw_text") or "", now, now),
+                ).fetchone()[0]
+                self._conn.execute("DELETE FROM line_items WHERE invoice_id = ?", (invoice_id,))
+                self._conn.executemany(
+                    "INSERT INTO line_items (invoice_id, position, product_code) VALUES (?, ?, ?)",
+                    [(invoice_id, i, item.get("product_code") or None) for i, item in enumerate(items)
+                     if isinstance(item, dict)],
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return invoice_id
+
+    def id_for(self, source_sha256: str) -> Optional[int]:
+        """Id of the invoice parsed from the file with this hash, if it is stored."""
+        row = self._execute("SELECT id FROM invoices WHERE source_sha256 = ?", (source_sha256,)).fetchone()
+        return row[0] if row else None
+
+    def get(self, invoice_id: int) -> Optional[Dict[str, Any]]:
+        """The stored invoice as /upload returned it, plus its id, filename and source hash."""
+        row = self._execute(
+            "SELECT id, source_sha256, filename, data, raw_text, created_at, updated_at FROM invoices WHERE id = ?",
+            (invoice_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        invoice = json.loads(row["data"])
+        invoice["raw_text"] = row["raw_text"]
+        invoice.update(invoice_id=row["id"], source_sha256=row["source_sha256"], filename=row["filename"],
+                       created_at=row["created_at"], updated_at=row["updated_at"])
+        return invoice
+
+    def find(self, invoice_number: Optional[str] = None, po_number: Optional[str] = None,
+             vendor_name: Optional[str] = None, product_code: Optional[str] = None,
+             date_from: Optional[str] = None, date_to: Optional[str] = None,
+             limit: int = 50, offset: int = 0) -> List[Dict[str, Any]]:
+        """Invoices matching every given filter, newest first.
+
+        ``vendor_name`` is matched case-insensitively; ``date_from`` and
+        ``date_to`` bound the invoice date (inclusive), and results are then
+        ordered by invoice date.
+        """
+        clauses, params = [], []
+        for column, value in (("invoice_number", invoice_number), ("po_number", po_number),
+                              ("vendor_name", vendor_name)):
+            if value:
+                clauses.append(f"invoices.{column} = ?")
+                params.append(value)
+        if date_from:
+            clauses.append("invoices.invoice_date >= ?")
+            params.append(iso_date(date_from) or date_from)
+        if date_to:
+            clauses.append("invoices.invoice_date <= ?")
+            params.append(iso_date(date_to) or date_to)
+        if product_code:
+            clauses.append("invoices.id IN (SELECT invoice_id FROM line_items WHERE product_code = ?)")
+            params.append(product_code)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # With a date range, walk the date index instead of sorting every invoice in it
+        order = "invoices.invoice_date DESC, invoices.id DESC" if date_from or date_to else "invoices.id DESC"
+        rows = self._execute(
+            f"SELECT {_SUMMARY_SQL} FROM invoices {where} ORDER BY {order} LIMIT ? OFFSET ?",
+            (*params, limit, offset),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def search(self, text: str, limit: int = 20) -> List[Dict[str, Any]]:
+        """Full-text search over raw_text, newest first, with a highlighted snippet.
+
+        Newest first rather than by relevance: ranking has to score every
+        match, which for a common word means most of the store.
+        """
+        query = fts_query(text)
+        if not query:
+            return []
+        rows = self._execute(
+            f"SELECT {_SUMMARY_SQL}, snippet(invoices_fts, 0, '[', ']', '...', 12) AS snippet "
+            "FROM invoices_fts JOIN invoices ON invoices.id = invoices_fts.rowid "
+            "WHERE invoices_fts MATCH ? ORDER BY invoices_fts.rowid DESC LIMIT ?",
+            (query, limit),
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def count(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM invoices").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            # Refresh the query planner's statistics if they're out of date
+            self._conn.execute("PRAGMA optimize")
+            self._conn.close()
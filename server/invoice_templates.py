@@ -0,0 +1,290 @@
+"""Declarative invoice layouts and the single-pass parser that applies them.
+
+Each vendor layout is an InvoiceTemplate: a list of header FieldRules (a
+keyword plus how to read the value) and a LineItemSpec (where the item
+table starts, which lines to skip, and regexes for an item line).
+TemplateEngine compiles every template's keywords into one combined regex
+and precompiles the item patterns, then walks the text once, feeding every
+template at the same time. The template that recognised the most fields and
+line items wins, and only its line items are parsed.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+INVOICE_FIELDS = ("invoice_number", "po_number", "date", "due_date", "vendor_name", "total_amount")
+
+
+@dataclass(frozen=True)
+class FieldRule:
+    """How to read one header field.
+
+    ``key`` is matched case-insensitively, anywhere in the line
+    (``anchor="contains"``) or at its start (``anchor="startswith"``).
+    ``value`` is one of:
+
+    * ``after_colon``: the text after the line's last colon
+    * ``after_key``: the text after the keyword, minus leading ``:``/``#``
+    * ``last_token``: the line's last whitespace-separated token
+    * ``next_line``: the whole following line
+    """
+    field: str
+    key: str
+    value: str = "after_colon"
+    anchor: str = "contains"
+    dedupe_words: bool = False
+
+
+@dataclass(frozen=True)
+class LineItemSpec:
+    """Where the line-item table is and how to read its rows.
+
+    The table starts at the first line containing every keyword in
+    ``section_start``. Inside it, lines starting with a ``skip_prefixes``
+    entry are ignored. A line matching one of ``patterns`` (tried in order)
+    is an item, and the pattern's named groups (product_code, description,
+    quantity, rate, amount) become its fields. Other lines extend the
+    previous item's description when ``continuation`` is set.
+    """
+    section_start: Tuple[str, ...]
+    patterns: Tuple[str, ...]
+    skip_prefixes: Tuple[str, ...] = ("total", "thank")
+    continuation: bool = True
+
+
+@dataclass(frozen=True)
+class InvoiceTemplate:
+    name: str
+    fields: Tuple[FieldRule, ...]
+    line_items: Optional[LineItemSpec] = None
+
+
+# The layout parse_invoice_data has always handled (QuickBooks-style export).
+DEFAULT_TEMPLATE = InvoiceTemplate(
+    name="default",
+    fields=(
+        FieldRule("vendor_name", "bill to ship to", value="next_line", dedupe_words=True),
+        FieldRule("po_number", "invoice details po number:"),
+        FieldRule("invoice_number", "invoice no.:"),
+        FieldRule("date", "invoice date:"),
+        FieldRule("due_date", "due date:"),
+        FieldRule("total_amount", "total", value="last_token", anchor="startswith"),
+    ),
+    line_items=LineItemSpec(
+        section_start=("product or service", "qty"),
+        patterns=(
+            # code, description, quantity (last integer before the rate), rate (first dollar value)
+            # (the lookahead keeps the code whole instead of backtracking into it)
+            r"^\d+\.\s+(?=(?P<product_code>[^ ,]+))(?P=product_code)(?P<description>[^$]*)\b(?P<quantity>\d{1,6})\b[^$]*\$(?P<rate>[\d,.]+)",
+            # rate without a quantity: everything after the code is description
+            r"^\d+\.\s+(?=(?P<product_code>[^ ,]+))(?P=product_code)(?P<description>[^$]*\$(?P<rate>[\d,.]+).*)$",
+            # any other numbered line is still an item
+            r"^\d+\.\s+(?P<product_code>[^ ,]*)(?P<description>.*)$",
+        ),
+    ),
+)
+
+# Common "Invoice # / Bill To: / Description Qty Rate Amount" layout.
+GENERIC_TEMPLATE = InvoiceTemplate(
+    name="generic",
+    fields=(
+        FieldRule("vendor_name", "bill to:", value="next_line"),
+        FieldRule("po_number", "p.o. number", value="after_key"),
+        FieldRule("po_number", "po #", value="after_key"),
+        FieldRule("invoice_number", "invoice #", value="after_key"),
+        FieldRule("invoice_number", "invoice number", value="after_key"),
+        FieldRule("date", "invoice date", value="after_key"),
+        FieldRule("due_date", "payment due", value="after_key"),
+        FieldRule("total_amount", "amount due", value="last_token", anchor="startswith"),
+        FieldRule("total_amount", "balance due", value="last_token", anchor="startswith"),
+    ),
+    line_items=LineItemSpec(
+        section_start=("description", "amount"),
+        patterns=(
+            r"^(?P<product_code>[A-Za-z0-9][\w\-./]*)\s+(?P<description>.+?)\s+(?P<quantity>\d[\d,]*)\s+"
+            r"\$?(?P<rate>[\d,]+\.\d{2})\s+\$?(?P<amount>[\d,]+\.\d{2})$",
+        ),
+        skip_prefixes=("subtotal", "total", "tax", "amount due", "balance due", "thank"),
+        continuation=False,
+    ),
+)
+
+TEMPLATES: Tuple[InvoiceTemplate, ...] = (DEFAULT_TEMPLATE, GENERIC_TEMPLATE)
+
+
+@dataclass
+class _TemplateState:
+    """Per-template results gathered during the single pass."""
+    data: Dict[str, Any]
+    in_items: bool = False
+    matched_fields: set = field(default_factory=set)
+    item_lines: List[int] = field(default_factory=list)
+
+
+class TemplateEngine:
+    def __init__(self, templates: Sequence[InvoiceTemplate] = TEMPLATES):
+        if not templates:
+            raise ValueError("TemplateEngine needs at least one template")
+        self.templates = tuple(templates)
+
+        # keyword -> [(template index, rule)]; section keywords use rule=None
+        contains: Dict[str, List[Tuple[int, Optional[FieldRule]]]] = {}
+        startswith: Dict[str, List[Tuple[int, Optional[FieldRule]]]] = {}
+        for t, template in enumerate(self.templates):
+            for rule in template.fields:
+                if rule.field not in INVOICE_FIELDS:
+                    raise ValueError(f"{template.name}: unknown field {rule.field!r}")
+                target = startswith if rule.anchor == "startswith" else contains
+                target.setdefault(rule.key.lower(), []).append((t, rule))
+            if template.line_items:
+                for key in template.line_items.section_start:
+                    contains.setdefault(key.lower(), []).append((t, None))
+
+        self._contains = contains
+        self._startswith = startswith
+        self._contains_re = self._alternation(contains, anchored=False)
+        self._startswith_re = self._alternation(startswith, anchored=True)
+        self._start_prefixes = tuple(startswith)
+        # A keyword that occurs inside a longer one is hidden when the longer
+        # one matches, so credit it explicitly.
+        self._nested = {
+            key: [other for other in contains if other != key and other in key]
+            for key in contains
+        }
+        self._nested_start = {
+            key: [other for other in startswith if other != key and key.startswith(other)]
+            for key in startswith
+        }
+
+        self._item_patterns = []
+        self._skip_prefixes = []
+        self._section_keys = []
+        for template in self.templates:
+            spec = template.line_items
+            self._section_keys.append(tuple(k.lower() for k in spec.section_start) if spec else ())
+            self._item_patterns.append([re.compile(p) for p in spec.patterns] if spec else [])
+            self._skip_prefixes.append(tuple(p.lower() for p in spec.skip_prefixes) if spec else ())
+
+    @staticmethod
+    def _alternation(keys: Dict[str, Any], anchored: bool):
+        if not keys:
+            return None
+        # Longest first so a keyword never shadows a longer one at the same position
+        body = "|".join(re.escape(k) for k in sorted(keys, key=len, reverse=True))
+        return re.compile(f"^(?:{body})" if anchored else body)
+
+    def _line_keys(self, line_lower: str):
+        """Keywords present in a line, as (contains_keys, startswith_keys)."""
+        found = ()
+        # Most lines have no keyword at all; a single search rules them out cheaply
+        if self._contains_re is not None and self._contains_re.search(line_lower):
+            found = set()
+            for m in self._contains_re.finditer(line_lower):
+                key = m.group(0)
+                found.add(key)
+                found.update(self._nested[key])
+        start_keys = ()
+        if self._start_prefixes and line_lower.startswith(self._start_prefixes):
+            key = self._startswith_re.match(line_lower).group(0)
+            start_keys = (key, *self._nested_start[key])
+        return found, start_keys
+
+    @staticmethod
+    def _field_value(rule: FieldRule, line: str, line_lower: str, next_line: Optional[str]) -> Optional[str]:
+        if rule.value == "next_line":
+            if next_line is None:
+                return None
+            value = next_line
+        elif rule.value == "last_token":
+            parts = line.split()
+            value = parts[-1] if parts else ""
+        elif rule.value == "after_key":
+            pos = line_lower.find(rule.key) + len(rule.key)
+            value = line[pos:].lstrip(" :#\t").strip()
+        else:
+            value = line.split(":")[-1].strip()
+        if rule.dedupe_words:
+            # Only use the first occurrence of each word ("Acme Acme" -> "Acme")
+            value = " ".join(dict.fromkeys(value.split()))
+        return value
+
+    def _parse_items(self, t: int, lines: List[str], item_lines: List[int]) -> List[Dict[str, str]]:
+        """Parse the line-item rows a template collected during the pass."""
+        spec = self.templates[t].line_items
+        patterns = self._item_patterns[t]
+        items: List[Dict[str, str]] = []
+        for i in item_lines:
+            line = lines[i]
+            m = None
+            for pattern in patterns:
+                m = pattern.match(line)
+                if m:
+                    break
+            if m is not None:
+                groups = m.groupdict()
+                items.append({
+                    "product_code": (groups.get("product_code") or "").strip(),
+                    "description": (groups.get("description") or "").strip(),
+                    "quantity": groups.get("quantity") or "",
+                    "rate": groups.get("rate") or "",
+                    "amount": groups.get("amount") or "",
+                })
+            elif spec.continuation and items:
+                # Otherwise, treat as a continuation of the previous product's description
+                items[-1]["description"] += f" {line}"
+        return items
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        """Parse invoice text with every template in one pass and return the best result.
+
+        Header fields are read for every template during the pass; line-item
+        rows are only collected, and parsed afterwards for the winning
+        template alone.
+        """
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        states = [
+            _TemplateState(data={**{f: "" for f in INVOICE_FIELDS}, "line_items": []})
+            for _ in self.templates
+        ]
+        item_templates = [t for t, template in enumerate(self.templates) if template.line_items]
+        n = len(lines)
+        line_keys = self._line_keys
+        for i, line in enumerate(lines):
+            line_lower = line.lower()
+            keys, start_keys = line_keys(line_lower)
+
+            section_started = ()
+            if keys:
+                section_started = set()
+                next_line = lines[i + 1] if i + 1 < n else None
+                for key in keys:
+                    for t, rule in self._contains[key]:
+                        if rule is None:
+                            section_started.add(t)
+                            continue
+                        value = self._field_value(rule, line, line_lower, next_line)
+                        if value is not None:
+                            states[t].data[rule.field] = value
+                            states[t].matched_fields.add(rule.field)
+            for key in start_keys:
+                for t, rule in self._startswith[key]:
+                    states[t].data[rule.field] = self._field_value(rule, line, line_lower, None)
+                    states[t].matched_fields.add(rule.field)
+
+            for t in item_templates:
+                state = states[t]
+                if t in section_started and all(k in keys for k in self._section_keys[t]):
+                    state.in_items = True
+                    continue
+                if state.in_items and not line_lower.startswith(self._skip_prefixes[t]):
+                    state.item_lines.append(i)
+
+        # Most recognised header fields wins, then most line-item rows; ties go to the earlier template
+        best = max(range(len(states)),
+                   key=lambda t: (len(states[t].matched_fields), len(states[t].item_lines), -t))
+        data = states[best].data
+        if best in item_templates:
+            data["line_items"] = self._parse_items(best, lines, states[best].item_lines)
+        data["raw_text"] = text
+        data["template"] = self.templates[best].name
+        return data
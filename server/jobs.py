@@ -0,0 +1,325 @@
+"""Asynchronous extraction jobs backed by a local SQLite queue.
+
+A job is an uploaded file waiting to go through the extraction pipeline.
+Jobs are stored in SQLite so they survive restarts, and a JobRunner claims
+them and runs the job function in worker processes.
+
+* Claiming a job takes a lease, which is renewed while the job runs. A job
+  whose lease has expired (its server died mid-job) is claimed again, and
+  that counts as another attempt.
+* If a worker process crashes it is replaced and the job is retried,
+  up to ``max_attempts``.
+* Finished jobs are kept for ``result_ttl`` seconds, then evicted along with
+  their uploaded file.
+"""
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATUSES = (SUCCEEDED, FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    payload_path TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+"""
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already waiting."""
+
+
+class JobStore:
+    """Durable job queue in a SQLite file."""
+
+    def __init__(self, db_path: str, payload_dir: str):
+        self.db_path = db_path
+        self.payload_dir = payload_dir
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        os.makedirs(payload_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def submit(self, filename: str, content: Union[bytes, str], max_attempts: int = 3,
+               queue_limit: Optional[int] = None) -> str:
+        """Save the upload and queue a job for it, returning the job id.
+
+        ``content`` is the file's bytes, or the path of a temporary file that
+        is moved into the payload directory.
+        """
+        if queue_limit is not None and self.count(QUEUED) >= queue_limit:
+            raise JobQueueFull(f"{queue_limit} jobs are already queued")
+        job_id = uuid.uuid4().hex
+        payload_path = os.path.join(self.payload_dir, job_id + os.path.splitext(filename)[1].lower())
+        if isinstance(content, str):
+            shutil.move(content, payload_path)
+        else:
+            with open(payload_path, "wb") as f:
+                f.write(content)
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, status, filename, payload_path, max_attempts, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, QUEUED, filename, payload_path, max(1, max_attempts), now, now),
+        )
+        return job_id
+
+    def claim(self, lease_seconds: float) -> Optional[Dict[str, Any]]:
+        """Take the oldest queued job (or one whose lease expired) and mark it running."""
+        while True:
+            now = time.time()
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    row = self._conn.execute(
+                        "SELECT * FROM jobs WHERE status = ? OR (status = ? AND lease_expires_at < ?) "
+                        "ORDER BY created_at LIMIT 1",
+                        (QUEUED, RUNNING, now),
+                    ).fetchone()
+                    if row is None:
+                        self._conn.execute("COMMIT")
+                        return None
+                    exhausted = row["attempts"] >= row["max_attempts"]
+                    if exhausted:
+                        # Its previous owner died on the last attempt
+                        self._conn.execute(
+                            "UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ?, "
+                            "lease_expires_at = NULL WHERE id = ?",
+                            (FAILED, row["error"] or "Worker stopped before the job finished", now, now, row["id"]),
+                        )
+                    else:
+                        self._conn.execute(
+                            "UPDATE jobs SET status = ?, attempts = attempts + 1, updated_at = ?, "
+                            "lease_expires_at = ? WHERE id = ?",
+                            (RUNNING, now, now + lease_seconds, row["id"]),
+                        )
+                    self._conn.execute("COMMIT")
+                except Exception:
+                    self._conn.execute("ROLLBACK")
+                    raise
+            if not exhausted:
+                job = dict(row)
+                job["attempts"] += 1
+                return job
+            self._remove_payload(row["id"])
+
+    def renew(self, job_id: str, lease_seconds: float):
+        """Extend the lease of a running job."""
+        self._execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND status = ?",
+                      (time.time() + lease_seconds, job_id, RUNNING))
+
+    def complete(self, job_id: str, result: Dict[str, Any]):
+        now = time.time()
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = NULL, updated_at = ?, finished_at = ?, "
+            "lease_expires_at = NULL WHERE id = ?",
+            (SUCCEEDED, json.dumps(result), now, now, job_id),
+        )
+        self._remove_payload(job_id)
+
+    def fail(self, job_id: str, error: str, retry: bool = False):
+        """Record a failed attempt; requeue it if ``retry`` and attempts remain."""
+        now = time.time()
+        job = self.get(job_id)
+        if job is None:
+            return
+        if retry and job["attempts"] < job["max_attempts"]:
+            self._execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?, lease_expires_at = NULL WHERE id = ?",
+                (QUEUED, error, now, job_id),
+            )
+            return
+        self._execute(
+            "UPDATE jobs SET status = ?, error = ?, updated_at = ?, finished_at = ?, lease_expires_at = NULL "
+            "WHERE id = ?",
+            (FAILED, error, now, now, job_id),
+        )
+        self._remove_payload(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def count(self, status: str) -> int:
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (status,)).fetchone()[0]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: 0 for status in (QUEUED, RUNNING, SUCCEEDED, FAILED)} | {r[0]: r[1] for r in rows}
+
+    def evict_expired(self, result_ttl: float) -> int:
+        """Delete finished jobs older than ``result_ttl`` seconds."""
+        cutoff = time.time() - result_ttl
+        rows = self._execute(
+            "SELECT id, payload_path FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,)
+        ).fetchall()
+        for row in rows:
+            if os.path.exists(row["payload_path"]):
+                os.remove(row["payload_path"])
+        self._execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (cutoff,))
+        return len(rows)
+
+    def _remove_payload(self, job_id: str):
+        row = self._execute("SELECT payload_path FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row and os.path.exists(row["payload_path"]):
+            os.remove(row["payload_path"])
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobRunner:
+    """Runs queued jobs in ``workers`` worker processes, one job per process at a time.
+
+    ``job_fn(payload_path, filename)`` must be a picklable, module-level
+    function; its return value is stored as the job result, after passing
+    through ``on_result`` (called in the server process) when given.
+    ``initializer`` runs once in each new worker process.
+
+    Store calls run on threads so SQLite never blocks the event loop, and a
+    failing iteration (e.g. "database is locked") is logged and retried
+    after a backoff rather than ending the worker.
+    """
+
+    def __init__(self, store: JobStore, job_fn: Callable[[str, str], Any], workers: int = 2,
+                 lease_seconds: float = 600, result_ttl: float = 86400, poll_interval: float = 1.0,
+                 on_result: Optional[Callable[[Any], Dict[str, Any]]] = None,
+                 initializer: Optional[Callable[[], Any]] = None):
+        self.store = store
+        self.job_fn = job_fn
+        self.on_result = on_result
+        self.initializer = initializer
+        self.workers = max(1, workers)
+        self.lease_seconds = lease_seconds
+        self.result_ttl = result_ttl
+        self.poll_interval = poll_interval
+        self._pools: List[Optional[ProcessPoolExecutor]] = [None] * self.workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work(slot)) for slot in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._evict()))
+
+    def notify(self):
+        """Wake idle workers after a job is submitted."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _work(self, slot: int):
+        failures = 0
+        while True:
+            try:
+                job = await asyncio.to_thread(self.store.claim, self.lease_seconds)
+                if job is None:
+                    self._wakeup.clear()
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self._run(slot, job)
+                failures = 0
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failures += 1
+                backoff = min(60.0, self.poll_interval * 2 ** failures)
+                logger.error(f"Job worker {slot} failed ({e}); retrying in {backoff:.1f}s", exc_info=True)
+                await asyncio.sleep(backoff)
+
+    async def _run(self, slot: int, job: Dict[str, Any]):
+        # Each slot has its own single-process pool, so a crash is blamed on the right job
+        loop = asyncio.get_running_loop()
+        if self._pools[slot] is None:
+            self._pools[slot] = ProcessPoolExecutor(max_workers=1, initializer=self.initializer)
+        heartbeat = asyncio.create_task(self._heartbeat(job["id"]))
+        try:
+            result = await loop.run_in_executor(self._pools[slot], self.job_fn, job["payload_path"], job["filename"])
+            if self.on_result is not None:
+                result = await asyncio.to_thread(self.on_result, result)
+        except BrokenProcessPool:
+            logger.warning(f"Worker process crashed on job {job['id']} (attempt {job['attempts']})")
+            self._shutdown_pool(slot, wait=True)
+            await asyncio.to_thread(self.store.fail, job["id"], "Worker process crashed", True)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await asyncio.to_thread(self.store.fail, job["id"], f"{type(e).__name__}: {e}")
+        else:
+            await asyncio.to_thread(self.store.complete, job["id"], result)
+        finally:
+            heartbeat.cancel()
+
+    async def _heartbeat(self, job_id: str):
+        """Renew a running job's lease so it isn't claimed again while it legitimately takes long."""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.store.renew, job_id, self.lease_seconds)
+            except Exception as e:
+                logger.warning(f"Could not renew the lease of job {job_id}: {e}")
+
+    async def _evict(self):
+        while True:
+            try:
+                evicted = await asyncio.to_thread(self.store.evict_expired, self.result_ttl)
+                if evicted:
+                    logger.info(f"Evicted {evicted} expired jobs")
+            except Exception as e:
+                logger.error(f"Error evicting expired jobs: {e}")
+            await asyncio.sleep(min(self.result_ttl, 60))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for slot in range(self.workers):
+            self._shutdown_pool(slot)
+
+    def _shutdown_pool(self, slot: int, wait: bool = False):
+        if self._pools[slot] is not None:
+            self._pools[slot].shutdown(wait=wait, cancel_futures=True)
+            self._pools[slot] = None
@@ -1,34 +1,277 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Request
+from fastapi import Body, FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-import pytesseract
-import cv2
-import numpy as np
-from PIL import Image as PILImage
-from pdf2image.pdf2image import convert_from_path
-import pdfplumber
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.datastructures import MutableHeaders
+from starlette.routing import Match
 import re
 from datetime import datetime
 import os
 import tempfile
-from typing import Dict, Any, Optional
+from typing import TYPE_CHECKING, Dict, Any, Iterator, List, Optional, Tuple, Union
 import json
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import inch
-from reportlab.lib import colors
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_RIGHT, TA_CENTER, TA_LEFT
 import io
+import hashlib
 import logging
-from reportlab.platypus.flowables import Flowable
-from reportlab.platypus import Table, TableStyle, Spacer as RLSpacer
-from reportlab.platypus import KeepTogether
+from ocr_engine import OCR_OEM, OCR_PSM, OCR_WHITELIST, create_ocr_backend
+from invoice_templates import TemplateEngine
+from result_cache import ResultCache, config_fingerprint
+from jobs import FINISHED_STATUSES, JobQueueFull, JobRunner, JobStore
+from invoice_store import InvoiceStore
+from uploads import BodySizeLimitMiddleware, SpooledUpload, UploadTooLarge, read_upload
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram, StageTimings, current_timings
+import asyncio
+import threading
+import time
+import zipfile
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# OpenCV, numpy, pdfplumber, pdf2image, Tesseract and ReportLab are imported
+# where they are used, so a process only loads the pipelines it runs
+if TYPE_CHECKING:
+    import numpy as np
+
+logging.basicConfig(
+    level=os.environ.get("LOG_LEVEL", "INFO").upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+)
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Invoice Certification API", version="1.0.0")
 
-# Configure CORS
+def configure_tesseract_path():
+    """Configure Tesseract path for Windows"""
+    if os.name != "nt":
+        return
+    try:
+        import pytesseract
+        
+        # Try to find Tesseract in common Windows installation paths
+        tesseract_paths = [
+            r'C:\Program Files\Tesseract-OCR\tesseract.exe',
+            r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
+            r'C:\Users\ronmi\AppData\Local\Programs\Tesseract-OCR\tesseract.exe',
+            r'C:\Users\dimam\AppData\Local\Programs\Tesseract-OCR\tesseract.exe'
+        ]
+        
+        tesseract_found = False
+        for path in tesseract_paths:
+            if os.path.exists(path):
+                pytesseract.pytesseract.tesseract_cmd = path
+                tesseract_found = True
+                logger.info(f"Tesseract found at: {path}")
+                break
+        
+        if not tesseract_found:
+            logger.warning(
+                "Tesseract not found in the default Windows locations. Install it from "
+                "https://github.com/UB-Mannheim/tesseract/wiki to C:\\Program Files\\Tesseract-OCR\\ "
+                "and add it to PATH, or update the path in main.py. Otherwise OCR will be disabled."
+            )
+            
+    except Exception as e:
+        logger.error(f"Error configuring Tesseract: {e}. OCR functionality will be disabled.")
+
+# Uploads are streamed into memory, or into a temp file under UPLOAD_DIR past UPLOAD_SPOOL_BYTES
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads"))
+
+# Extraction execution settings. OCR and PDF rasterization are CPU-bound and
+# blocking, so they run on a worker pool instead of the event loop. By default
+# there is one worker per MAX_DEFAULT_PAGE_WORKERS cores, which OCR the pages
+# of a scan in parallel.
+MAX_DEFAULT_PAGE_WORKERS = 4
+EXTRACTION_EXECUTOR = os.environ.get("EXTRACTION_EXECUTOR", "process").lower()  # "process" or "thread"
+EXTRACTION_WORKERS = int(os.environ.get(
+    "EXTRACTION_WORKERS", str(-(-(os.cpu_count() or 1) // MAX_DEFAULT_PAGE_WORKERS))))
+EXTRACTION_QUEUE_LIMIT = int(os.environ.get("EXTRACTION_QUEUE_LIMIT", "16"))
+
+# Batch ingestion (/upload/batch) runs at most BATCH_CONCURRENCY extractions at once.
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", str(EXTRACTION_WORKERS)))
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "1000"))
+BATCH_MAX_MEMBER_BYTES = int(os.environ.get("BATCH_MAX_MEMBER_BYTES", str(50 * 1024 * 1024)))
+
+# Bulk certificate rendering runs on its own process pool. Each batch keeps at
+# most CERTIFICATE_BATCH_WINDOW rendered PDFs in memory at once.
+CERTIFICATE_WORKERS = int(os.environ.get("CERTIFICATE_WORKERS", str(os.cpu_count() or 2)))
+CERTIFICATE_BATCH_WINDOW = int(os.environ.get("CERTIFICATE_BATCH_WINDOW", str(2 * CERTIFICATE_WORKERS)))
+CERTIFICATE_BATCH_MAX_ITEMS = int(os.environ.get("CERTIFICATE_BATCH_MAX_ITEMS", "1000"))
+# A merged PDF has to be assembled completely before it can be written, so it gets a lower cap.
+CERTIFICATE_MERGE_MAX_ITEMS = int(os.environ.get("CERTIFICATE_MERGE_MAX_ITEMS", "500"))
+
+# Scanned PDFs are OCR'd page by page on this many threads. Each Tesseract
+# process is limited to OCR_THREAD_LIMIT OpenMP threads, so the total number of
+# busy cores is roughly EXTRACTION_WORKERS * OCR_PAGE_WORKERS * OCR_THREAD_LIMIT;
+# the default splits the cores between the extraction workers.
+OCR_PAGE_WORKERS = int(os.environ.get("OCR_PAGE_WORKERS", str(
+    max(1, min(MAX_DEFAULT_PAGE_WORKERS, (os.cpu_count() or 1) // max(1, EXTRACTION_WORKERS))))))
+OCR_THREAD_LIMIT = os.environ.get("OCR_THREAD_LIMIT", "1")
+os.environ.setdefault("OMP_THREAD_LIMIT", OCR_THREAD_LIMIT)
+
+# Scanned PDFs are rasterized OCR_RASTER_WINDOW pages at a time, which bounds
+# peak memory to about OCR_RASTER_WINDOW grayscale pages (~8 MB each at 300 DPI).
+OCR_RASTER_DPI = int(os.environ.get("OCR_RASTER_DPI", "300"))
+OCR_RASTER_WINDOW = int(os.environ.get("OCR_RASTER_WINDOW", str(OCR_PAGE_WORKERS)))
+
+# OCR engine: "tesserocr" keeps a pool of in-process engines, "pytesseract"
+# launches the tesseract executable per image, "auto" prefers tesserocr.
+OCR_BACKEND = os.environ.get("OCR_BACKEND", "auto").lower()
+OCR_ENGINE_POOL_SIZE = int(os.environ.get("OCR_ENGINE_POOL_SIZE", str(OCR_PAGE_WORKERS)))
+
+# Image preprocessing before OCR: "standard" thresholds the whole page as is,
+# "fast" rescales to OCR_TEXT_HEIGHT px text lines and OCRs only the bands with ink.
+OCR_PREPROCESS = os.environ.get("OCR_PREPROCESS", "standard").lower()
+OCR_TEXT_HEIGHT = int(os.environ.get("OCR_TEXT_HEIGHT", "40"))
+
+# A PDF page whose text layer has fewer non-whitespace characters than this is OCR'd.
+TEXT_LAYER_MIN_CHARS = int(os.environ.get("TEXT_LAYER_MIN_CHARS", "20"))
+
+# Bump whenever parse_invoice_data output changes so cached results are invalidated.
+PARSER_VERSION = "2"
+
+# Repeat uploads of the same bytes are answered from a two-tier result cache.
+RESULT_CACHE_ENABLED = os.environ.get("RESULT_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache"))
+RESULT_CACHE_ENTRIES = int(os.environ.get("RESULT_CACHE_ENTRIES", "256"))
+RESULT_CACHE_DISK_ENTRIES = int(os.environ.get("RESULT_CACHE_DISK_ENTRIES", "10000"))
+
+# Long-running extractions can be submitted as jobs to a durable SQLite queue
+JOB_DIR = os.environ.get("JOB_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "jobs"))
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", os.path.join(JOB_DIR, "jobs.sqlite3"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", "500"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+# A running job whose lease expires (its server died) is picked up again
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "900"))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", str(24 * 3600)))
+JOB_EVENTS_POLL_INTERVAL = float(os.environ.get("JOB_EVENTS_POLL_INTERVAL", "0.5"))
+
+# Parsed invoices are kept in a SQLite store for lookup, search and certificate re-issue
+INVOICE_STORE_ENABLED = os.environ.get("INVOICE_STORE_ENABLED", "1").lower() not in ("0", "false", "no")
+INVOICE_DB_PATH = os.environ.get(
+    "INVOICE_DB_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "invoices.sqlite3"))
+INVOICE_LOOKUP_MAX_RESULTS = int(os.environ.get("INVOICE_LOOKUP_MAX_RESULTS", "500"))
+
+# With WARM_UP=1 the extraction and certificate pipelines are loaded and their
+# worker pools started right after startup; /ready answers 503 until that is done.
+WARM_UP = os.environ.get("WARM_UP", "0").lower() in ("1", "true", "yes")
+
+# Per-request stage timings are always logged; set SERVER_TIMING=1 to also send them to clients
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+
+REQUESTS = REGISTRY.register(Counter(
+    "invoice_http_requests_total", "HTTP requests by endpoint and status code", ("method", "endpoint", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "invoice_http_request_duration_seconds", "Time until the response starts, by endpoint", ("method", "endpoint")))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "invoice_http_requests_in_flight", "Requests being handled, by endpoint", ("method", "endpoint")))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "invoice_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",)))
+DOCUMENT_PAGES = REGISTRY.register(Histogram(
+    "invoice_document_pages", "Pages per extracted document", (), buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500)))
+PAGES = REGISTRY.register(Counter(
+    "invoice_pages_total", "Extracted pages by method (text layer, OCR, or failed OCR)", ("method",)))
+RESULT_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    "invoice_result_cache_lookups_total", "Result cache lookups by outcome", ("result",)))
+CERTIFICATES = REGISTRY.register(Counter(
+    "invoice_certificates_total", "Certificates rendered, by outcome", ("status",)))
+
+def _page_ratio() -> float:
+    text, ocr = PAGES.value(method="text"), PAGES.value(method="ocr") + PAGES.value(method="none")
+    return ocr / (text + ocr) if text + ocr else 0.0
+
+def _cache_hit_ratio() -> float:
+    hits, misses = RESULT_CACHE_LOOKUPS.value(result="hit"), RESULT_CACHE_LOOKUPS.value(result="miss")
+    return hits / (hits + misses) if hits + misses else 0.0
+
+REGISTRY.register(Gauge("invoice_ocr_page_ratio", "Share of extracted pages that needed OCR", callback=_page_ratio))
+REGISTRY.register(Gauge("invoice_result_cache_hit_ratio", "Share of result cache lookups that hit",
+                        callback=_cache_hit_ratio))
+
+def record_stages(durations: Dict[str, float]):
+    """Observe stage durations and add them to the current request's timings."""
+    for stage, seconds in durations.items():
+        STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = current_timings.get()
+    if timings is not None:
+        timings.merge(durations)
+
+@contextmanager
+def timed_stage(stage: str):
+    """Time one stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stages({stage: time.perf_counter() - start})
+
+request_logger = logging.getLogger("invoice.requests")
+
+def _endpoint(scope) -> str:
+    """Route template of a request, so /jobs/<id> is one endpoint in the metrics."""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+class RequestMetricsMiddleware:
+    """Counts, times and logs every HTTP request.
+
+    The request's stage timings are written to the ``invoice.requests`` log as
+    one JSON object and, with SERVER_TIMING enabled, sent as a
+    ``Server-Timing`` header (covering the stages finished before the
+    response starts).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method, endpoint = scope["method"], _endpoint(scope)
+        timings = StageTimings()
+        token = current_timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_metrics(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - start
+                REQUEST_SECONDS.observe(elapsed, method=method, endpoint=endpoint)
+                if SERVER_TIMING:
+                    timings.add("total", elapsed)
+                    MutableHeaders(scope=message).append("Server-Timing", timings.server_timing())
+            await send(message)
+
+        try:
+            with REQUESTS_IN_FLIGHT.track(method=method, endpoint=endpoint):
+                await self.app(scope, receive, send_with_metrics)
+        finally:
+            current_timings.reset(token)
+            REQUESTS.inc(method=method, endpoint=endpoint, status=str(status))
+            request_logger.info(json.dumps({
+                "method": method,
+                "path": scope["path"],
+                "endpoint": endpoint,
+                "status": status,
+                "duration_ms": round((time.perf_counter() - start) * 1000, 1),
+                "stages_ms": {k: round(v * 1000, 1) for k, v in timings.as_dict().items() if k != "total"},
+            }))
+
+# Single-file upload bodies: the file plus some room for the multipart framing
+_upload_body_limit = MAX_UPLOAD_BYTES + 64 * 1024
+app.add_middleware(BodySizeLimitMiddleware, limits={"/upload": _upload_body_limit, "/jobs": _upload_body_limit})
+
+# Configure CORS. Added after the size limit so it wraps it, and browsers can read its 413s
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -37,432 +280,1080 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Configure Tesseract path for Windows
-try:
-    # Try to find Tesseract in common Windows installation paths
-    tesseract_paths = [
-        r'C:\Program Files\Tesseract-OCR\tesseract.exe',
-        r'C:\Program Files (x86)\Tesseract-OCR\tesseract.exe',
-        r'C:\Users\ronmi\AppData\Local\Programs\Tesseract-OCR\tesseract.exe',
-        r'C:\Users\dimam\AppData\Local\Programs\Tesseract-OCR\tesseract.exe'
-    ]
-    
-    tesseract_found = False
-    for path in tesseract_paths:
-        if os.path.exists(path):
-            pytesseract.pytesseract.tesseract_cmd = path
-            tesseract_found = True
-            print(f"Tesseract found at: {path}")
-            break
-    
-    if not tesseract_found:
-        print("WARNING: Tesseract not found. Please install Tesseract OCR:")
-        print("1. Download from: https://github.com/UB-Mannheim/tesseract/wiki")
-        print("2. Install to C:\\Program Files\\Tesseract-OCR\\")
-        print("3. Add to PATH or update the path in main.py")
-        print("For now, OCR functionality will be disabled.")
-        
-except Exception as e:
-    print(f"Error configuring Tesseract: {e}")
-    print("OCR functionality will be disabled.")
+# Added last so it is outermost and also sees requests rejected by the size limit
+app.add_middleware(RequestMetricsMiddleware)
+
+# The OCR engine and preprocessor are created on first use (or by the warm-up),
+# so processes that never OCR don't load Tesseract or OpenCV
+_ocr_engine = None
+_ocr_preprocessor = None
+_ocr_lock = threading.Lock()
+
+def get_ocr_engine():
+    """The OCR backend. Tesseract availability is detected once here rather than on every page."""
+    global _ocr_engine
+    with _ocr_lock:
+        if _ocr_engine is None:
+            configure_tesseract_path()
+            _ocr_engine = create_ocr_backend(OCR_BACKEND, OCR_ENGINE_POOL_SIZE, os.environ.get("OCR_TESSDATA_PATH"))
+            if _ocr_engine.available:
+                logger.info(f"OCR backend: {_ocr_engine.name} (Tesseract {_ocr_engine.version})")
+        return _ocr_engine
+
+def get_ocr_preprocessor():
+    global _ocr_preprocessor
+    with _ocr_lock:
+        if _ocr_preprocessor is None:
+            from preprocessing import create_preprocessor
+            _ocr_preprocessor = create_preprocessor(OCR_PREPROCESS, OCR_TEXT_HEIGHT)
+        return _ocr_preprocessor
+
+# Invoice layouts are compiled once into a single-pass matcher
+invoice_template_engine = TemplateEngine()
+
+@contextmanager
+def pdf_file(pdf: Union[str, bytes]):
+    """Path of the PDF, writing in-memory bytes to a temp file for poppler first."""
+    if isinstance(pdf, str):
+        yield pdf
+        return
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf)
+        yield path
+    finally:
+        os.remove(path)
 
 class InvoiceParser:
-    def __init__(self):
+    def __init__(self, timings: Optional[StageTimings] = None, preprocessor=None):
         self.extracted_data = {}
+        self.timings = timings or StageTimings()
+        self.preprocessor = preprocessor or get_ocr_preprocessor()
     
-    def preprocess_image(self, image: np.ndarray) -> np.ndarray:
-        """Enhance image for better OCR results"""
-        # Convert to grayscale
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        
-        # Apply Gaussian blur to reduce noise
-        blurred = cv2.GaussianBlur(gray, (5, 5), 0)
-        
-        # Apply threshold to get binary image
-        _, thresh = cv2.threshold(blurred, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-        
-        # Apply morphological operations to clean up
-        kernel = np.ones((1, 1), np.uint8)
-        cleaned = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, kernel)
+    def preprocess_image(self, image: "np.ndarray") -> List["np.ndarray"]:
+        """Enhance image for better OCR results, returning the binarized regions to OCR in reading order"""
+        return self.preprocessor.regions(image)
+    
+    def extract_text_from_image(self, image: Union[str, bytes]) -> Tuple[str, bool]:
+        """Extract text from an image file path or encoded image bytes using OCR, as ``(text, ok)``"""
+        import cv2
+        import numpy as np
         
-        return cleaned
+        # Decode straight to grayscale; bytes never touch the disk
+        with self.timings.stage("image_decode"):
+            if isinstance(image, str):
+                image = cv2.imread(image, cv2.IMREAD_GRAYSCALE)
+            else:
+                image = cv2.imdecode(np.frombuffer(image, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if image is None:
+            logger.error("Error in OCR: Could not read image")
+            return "", False
+        return self.extract_text_from_array(image)
     
-    def extract_text_from_image(self, image_path: str) -> str:
-        """Extract text from image using OCR"""
+    def extract_text_from_array(self, image: "np.ndarray") -> Tuple[str, bool]:
+        """Extract text from an in-memory image (BGR or grayscale) using OCR.
+
+        Returns ``(text, ok)``; when OCR is unavailable or fails, ``("", False)``
+        so no error message ever ends up in the text being parsed.
+        """
         try:
             # Check if Tesseract is available
-            try:
-                pytesseract.get_tesseract_version()
-            except Exception:
-                print("Tesseract not available, returning placeholder text")
-                return "Tesseract OCR not available. Please install Tesseract for image processing."
-            
-            # Read image
-            image = cv2.imread(image_path)
-            if image is None:
-                raise ValueError("Could not read image")
+            ocr_engine = get_ocr_engine()
+            if not ocr_engine.available:
+                logger.warning("Tesseract not available, skipping OCR")
+                return "", False
             
             # Preprocess image
-            processed_image = self.preprocess_image(image)
-            
-            # OCR configuration for better accuracy
-            custom_config = r'--oem 3 --psm 6 -c tessedit_char_whitelist=0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$%()/\- '
+            with self.timings.stage("preprocess"):
+                regions = self.preprocess_image(image)
             
             # Extract text
-            text = pytesseract.image_to_string(processed_image, config=custom_config)
+            with self.timings.stage("ocr"):
+                text = "\n".join(ocr_engine.recognize(region).strip() for region in regions)
             
-            return text.strip()
+            return text.strip(), True
         except Exception as e:
-            print(f"Error in OCR: {str(e)}")
-            return f"Error processing image: {str(e)}"
+            logger.error(f"Error in OCR: {str(e)}")
+            return "", False
     
-    def extract_text_from_pdf(self, pdf_path: str) -> str:
-        """Extract text from PDF using multiple methods"""
-        text = ""
+    def iter_page_windows(self, pdf_path: str, page_numbers: List[int]) -> Iterator[List["np.ndarray"]]:
+        """Rasterize the given PDF pages a few at a time, yielding grayscale pixel arrays.
+
+        Consecutive pages are rendered together with ``first_page``/``last_page``
+        so no other page is touched, and only OCR_RASTER_WINDOW pages are held
+        in memory at once, however long the document is.
+        """
+        import numpy as np
+        from pdf2image.pdf2image import convert_from_path
+        
+        window = max(1, OCR_RASTER_WINDOW)
+        i = 0
+        while i < len(page_numbers):
+            # Extend the run while pages stay consecutive and the window has room
+            j = i + 1
+            while j < len(page_numbers) and j - i < window and page_numbers[j] == page_numbers[j - 1] + 1:
+                j += 1
+            with self.timings.stage("rasterize"):
+                pages = convert_from_path(pdf_path, dpi=OCR_RASTER_DPI, first_page=page_numbers[i],
+                                          last_page=page_numbers[j - 1], grayscale=True)
+                arrays = [np.asarray(page) for page in pages]
+            del pages
+            yield arrays
+            i = j
+    
+    def ocr_pages(self, pdf_path: str, page_numbers: List[int]) -> Iterator[Tuple[str, bool]]:
+        """OCR the given PDF pages in parallel, yielding ``(text, ok)`` in page order"""
+        workers = min(OCR_PAGE_WORKERS, OCR_RASTER_WINDOW, len(page_numbers))
+        if workers <= 1:
+            for arrays in self.iter_page_windows(pdf_path, page_numbers):
+                yield from (self.extract_text_from_array(image) for image in arrays)
+            return
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ocr-page") as pool:
+            for arrays in self.iter_page_windows(pdf_path, page_numbers):
+                yield from pool.map(self.extract_text_from_array, arrays)
+    
+    def extract_pages_from_pdf(self, pdf: Union[str, bytes]) -> List[Dict[str, Any]]:
+        """Extract text page by page, OCR'ing only pages without a usable text layer.
+
+        ``pdf`` is a file path or the PDF's bytes. Returns one
+        ``{"page", "method", "text"}`` dict per page, where method is
+        ``"text"`` (pdfplumber), ``"ocr"`` (rasterized + Tesseract) or
+        ``"none"`` (OCR failed; only the page's own short text layer is kept).
+        """
+        import pdfplumber
+        
+        pages: List[Dict[str, Any]] = []
         
         try:
-            # Method 1: Try pdfplumber first (better for text-based PDFs)
-            with pdfplumber.open(pdf_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
+            # Method 1: Use the text layer wherever a page has one
+            source = pdf if isinstance(pdf, str) else io.BytesIO(pdf)
+            with self.timings.stage("text_layer"), pdfplumber.open(source) as document:
+                for number, page in enumerate(document.pages, start=1):
+                    page_text = (page.extract_text() or "").strip()
+                    if len(re.sub(r"\s", "", page_text)) >= TEXT_LAYER_MIN_CHARS:
+                        pages.append({"page": number, "method": "text", "text": page_text})
+                    else:
+                        pages.append({"page": number, "method": "ocr", "text": page_text})
             
-            # Method 2: If no text found, convert to images and use OCR
-            if not text.strip():
+            # Method 2: Rasterize and OCR only the pages that need it
+            ocr_numbers = [p["page"] for p in pages if p["method"] == "ocr"]
+            if ocr_numbers:
                 try:
-                    images = convert_from_path(pdf_path, dpi=300)
-                    for i, image in enumerate(images):
-                        # Save image temporarily
-                        temp_image_path = f"temp_page_{i}.png"
-                        image.save(temp_image_path, "PNG")
-                        
-                        # Extract text from image
-                        page_text = self.extract_text_from_image(temp_image_path)
-                        text += page_text + "\n"
-                        
-                        # Clean up
-                        os.remove(temp_image_path)
+                    with pdf_file(pdf) as pdf_path:
+                        for page_number, (page_text, ok) in zip(ocr_numbers, self.ocr_pages(pdf_path, ocr_numbers)):
+                            if ok:
+                                pages[page_number - 1]["text"] = page_text
+                            else:
+                                pages[page_number - 1]["method"] = "none"
                 except Exception as e:
-                    print(f"Error converting PDF to images: {e}")
-                    print("You may need to install poppler-utils for PDF processing")
+                    logger.error(f"Error converting PDF to images: {e}. "
+                                 "You may need to install poppler-utils for PDF processing")
+                    for p in pages:
+                        if p["method"] == "ocr":
+                            p["method"] = "none"
                     
         except Exception as e:
-            print(f"Error extracting text from PDF: {str(e)}")
+            logger.error(f"Error extracting text from PDF: {str(e)}")
         
-        return text.strip()
+        return pages
+    
+    def extract_text_from_pdf(self, pdf: Union[str, bytes]) -> str:
+        """Extract text from PDF using multiple methods"""
+        pages = self.extract_pages_from_pdf(pdf)
+        return "\n".join(p["text"] for p in pages if p["text"]).strip()
     
     def parse_invoice_data(self, text: str) -> Dict[str, Any]:
-        """Parses the invoice text based on the user's exact structural rules."""
-        data = {
-            "invoice_number": "", "po_number": "", "date": "", "due_date": "",
-            "vendor_name": "", "total_amount": "", "line_items": [], "raw_text": text
-        }
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-
-        # --- Header and Customer Extraction based on literal text matching ---
-        for i, line in enumerate(lines):
-            line_lower = line.lower()
-            if "bill to ship to" in line_lower and i + 1 < len(lines):
-                customer_line = lines[i+1]
-                # Only use the first unique name (split by space, remove duplicates)
-                customer_parts = customer_line.split()
-                seen = set()
-                unique_customer = []
-                for part in customer_parts:
-                    if part not in seen:
-                        unique_customer.append(part)
-                        seen.add(part)
-                data["vendor_name"] = ' '.join(unique_customer)
-            if "invoice details po number:" in line_lower:
-                data["po_number"] = line.split(":")[-1].strip()
-            if "invoice no.:" in line_lower:
-                data["invoice_number"] = line.split(":")[-1].strip()
-            if "invoice date:" in line_lower:
-                data["date"] = line.split(":")[-1].strip()
-            if "due date:" in line_lower:
-                data["due_date"] = line.split(":")[-1].strip()
-            if line_lower.startswith("total"):
-                data["total_amount"] = line.split()[-1]
-
-        # --- Line Item Extraction ---
-        in_item_section = False
-        for line in lines:
-            if "product or service" in line.lower() and "qty" in line.lower():
-                in_item_section = True
-                continue
-            if not in_item_section or line.lower().startswith("total") or line.lower().startswith("thank"):
-                continue
+        """Parse invoice text with the best-matching layout template (see invoice_templates)."""
+        with self.timings.stage("parse"):
+            return invoice_template_engine.parse(text)
 
-            if re.match(r"^\d+\.\s", line):
-                line_wo_num = re.sub(r"^\d+\.\s*", "", line)
-                # Extract rate (first dollar value)
-                rate_match = re.search(r"\$([\d,\.]+)", line_wo_num)
-                rate = rate_match.group(1) if rate_match else ''
-                # Extract qty (last integer before the first dollar sign)
-                qty = ''
-                if rate_match:
-                    before_rate = line_wo_num[:rate_match.start()]
-                    qty_candidates = re.findall(r"\b\d{1,6}\b", before_rate)
-                    if qty_candidates:
-                        qty = qty_candidates[-1]
-                # Extract product code (up to first space or comma)
-                code_match = re.match(r"([^ ,]+)", line_wo_num)
-                product_code = code_match.group(1).strip() if code_match else ''
-                # Description: everything after product code up to qty
-                desc_start = len(product_code)
-                desc_end = line_wo_num.find(qty) if qty else len(line_wo_num)
-                description = line_wo_num[desc_start:desc_end].strip()
-                print(f"DEBUG: Parsed product_code='{product_code}', description='{description}', qty='{qty}', rate='{rate}'")
-                data["line_items"].append({
-                    "product_code": product_code,
-                    "description": description,
-                    "quantity": qty,
-                    "rate": rate,
-                    "amount": ''
-                })
-            elif data["line_items"]:
-                # Otherwise, treat as a continuation of the previous product's description
-                data["line_items"][-1]["description"] += f" {line.strip()}"
-        return data
+def run_extraction(source: Union[str, bytes], is_pdf: bool, timings: Optional[StageTimings] = None,
+                   preprocess: Optional[str] = None) -> Dict[str, Any]:
+    """Extract and parse an invoice, given as a file path or its bytes. Runs inside the extraction pool.
+
+    ``preprocess`` overrides OCR_PREPROCESS for this run.
+    """
+    if preprocess:
+        from preprocessing import create_preprocessor
+    parser = InvoiceParser(timings, create_preprocessor(preprocess, OCR_TEXT_HEIGHT) if preprocess else None)
+    if is_pdf:
+        pages = parser.extract_pages_from_pdf(source)
+        extracted_text = "\n".join(p["text"] for p in pages if p["text"]).strip()
+    else:
+        extracted_text, ok = parser.extract_text_from_image(source)
+        pages = [{"page": 1, "method": "ocr" if ok else "none", "text": extracted_text}]
+    logger.debug(f"Extracted text length: {len(extracted_text) if extracted_text else 0}")
+    invoice_data = parser.parse_invoice_data(extracted_text)
+    invoice_data["extraction"] = {
+        "pages": [{"page": p["page"], "method": p["method"]} for p in pages],
+        "text_pages": sum(1 for p in pages if p["method"] == "text"),
+        "ocr_pages": sum(1 for p in pages if p["method"] == "ocr"),
+    }
+    return invoice_data
+
+def run_extraction_timed(source: Union[str, bytes], is_pdf: bool,
+                         preprocess: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, float]]:
+    """run_extraction, also returning its stage timings to the server process.
+
+    ``extraction`` is the wall time of the whole run; the other stages are
+    summed across pages, so parallel OCR can make them add up to more.
+    """
+    timings = StageTimings()
+    with timings.stage("extraction"):
+        invoice_data = run_extraction(source, is_pdf, timings, preprocess)
+    return invoice_data, timings.as_dict()
+
+def run_extraction_job(file_path: str, filename: str) -> Tuple[Dict[str, Any], Dict[str, float], Dict[str, str]]:
+    """Job body for the /jobs queue: the same pipeline as /upload, plus the file's hash for the invoice store."""
+    invoice_data, durations = run_extraction_timed(file_path, filename.lower().endswith('.pdf'))
+    sha256 = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            sha256.update(chunk)
+    return invoice_data, durations, {"filename": filename, "sha256": sha256.hexdigest()}
+
+def extraction_succeeded(invoice_data: Dict[str, Any]) -> bool:
+    """Whether every page of the document was read; failed extractions are neither cached nor stored."""
+    pages = invoice_data["extraction"]["pages"]
+    return bool(pages) and all(p["method"] != "none" for p in pages)
+
+def record_extraction(invoice_data: Dict[str, Any], durations: Dict[str, float]):
+    """Record the metrics of one extraction that ran in a worker."""
+    record_stages(durations)
+    pages = invoice_data["extraction"]["pages"]
+    DOCUMENT_PAGES.observe(len(pages))
+    for page in pages:
+        PAGES.inc(method=page["method"])
+
+class ExtractionQueueFull(Exception):
+    """Raised when the extraction pool already has its maximum number of jobs."""
+
+class ExtractionExecutor:
+    """Bounded execution layer for the blocking extraction pipeline.
+
+    At most ``workers`` jobs run at a time and at most ``queue_limit`` more
+    wait for a free worker; anything beyond that is rejected immediately so
+    callers can answer with 503 instead of piling up requests. Callers that
+    have no way to retry (batch ingestion) can instead wait for room.
+
+    A worker process that dies (e.g. killed for running out of memory)
+    breaks the whole process pool, failing every job on it. The pool is then
+    replaced, and each of those jobs is retried once in a process of its
+    own (at most ``workers`` such retries at a time), so only the job that
+    kills its worker again fails (with BrokenProcessPool).
+    """
+
+    def __init__(self, kind: str = "process", workers: int = 2, queue_limit: int = 16, initializer=None):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self.in_flight = 0
+        self.initializer = initializer
+        self._pool: Optional[Executor] = None
+        self._pool_lock = threading.Lock()
+        self._room: Optional[asyncio.Condition] = None
+        self._retry_slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.queue_limit
+
+    def _get_pool(self) -> Executor:
+        with self._pool_lock:
+            if self._pool is None:
+                if self.kind == "process":
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+                else:
+                    self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="extract")
+            return self._pool
+
+    def _discard_pool(self, pool: Executor):
+        """Drop a broken pool so the next job starts a new one (once, however many jobs it failed)."""
+        with self._pool_lock:
+            if self._pool is pool:
+                logger.warning("Extraction worker process died; starting a new pool")
+                self._pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    async def run(self, fn, *args, wait: bool = False):
+        """Run ``fn(*args)`` on the pool.
+
+        When the queue is full, raise ExtractionQueueFull, or with ``wait``
+        wait until there is room.
+        """
+        if self.in_flight >= self.capacity:
+            if not wait:
+                raise ExtractionQueueFull(f"Extraction queue is full ({self.in_flight}/{self.capacity})")
+            if self._room is None:
+                self._room = asyncio.Condition()
+            async with self._room:
+                await self._room.wait_for(lambda: self.in_flight < self.capacity)
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            pool = self._get_pool()
+            try:
+                return await loop.run_in_executor(pool, fn, *args)
+            except BrokenProcessPool:
+                self._discard_pool(pool)
+            # Most jobs on a broken pool were only bystanders of the crash
+            # at most ``workers`` of them at a time, however many jobs the crash failed
+            if self._retry_slots is None:
+                self._retry_slots = asyncio.Semaphore(self.workers)
+            async with self._retry_slots:
+                solo = ProcessPoolExecutor(max_workers=1, initializer=self.initializer)
+                try:
+                    return await loop.run_in_executor(solo, fn, *args)
+                finally:
+                    solo.shutdown(wait=False)
+        finally:
+            self.in_flight -= 1
+            if self._room is not None:
+                async with self._room:
+                    self._room.notify()
+
+    async def start(self):
+        """Start every worker ahead of the first job."""
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, os.getpid) for _ in range(self.workers)))
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+def warm_up_extraction(engines: bool = True):
+    """Import the extraction pipeline and create its OCR engine and preprocessor.
+
+    Runs in the server process, and as the initializer of each extraction
+    worker process when WARM_UP is set. ``engines`` also starts the pool of
+    in-process Tesseract engines, which is only useful where OCR runs.
+    """
+    import cv2  # noqa: F401
+    import pdfplumber  # noqa: F401
+    from pdf2image import pdf2image  # noqa: F401
+
+    get_ocr_preprocessor()
+    if engines:
+        get_ocr_engine().warm_up()
+    else:
+        get_ocr_engine()
+
+def warm_up_certificates():
+    """Import ReportLab and build the default certificate template."""
+    from certificate_template import get_certificate_template
+
+    get_certificate_template()
+
+extraction_executor = ExtractionExecutor(EXTRACTION_EXECUTOR, EXTRACTION_WORKERS, EXTRACTION_QUEUE_LIMIT,
+                                         initializer=warm_up_extraction if WARM_UP else None)
+REGISTRY.register(Gauge("invoice_extractions_in_flight", "Extractions running or waiting for a worker",
+                        callback=lambda: extraction_executor.in_flight))
+
+certificate_pool: Optional[ProcessPoolExecutor] = None
+_certificate_pool_lock = threading.Lock()
+_certificate_retry_slots: Optional[asyncio.Semaphore] = None
+
+def get_certificate_pool() -> ProcessPoolExecutor:
+    global certificate_pool
+    with _certificate_pool_lock:
+        if certificate_pool is None:
+            certificate_pool = ProcessPoolExecutor(max_workers=max(1, CERTIFICATE_WORKERS),
+                                                   initializer=warm_up_certificates if WARM_UP else None)
+        return certificate_pool
+
+def discard_certificate_pool(pool: ProcessPoolExecutor):
+    """Drop a broken certificate pool so the next render starts a new one."""
+    global certificate_pool
+    with _certificate_pool_lock:
+        if certificate_pool is pool:
+            logger.warning("Certificate worker process died; starting a new pool")
+            certificate_pool = None
+            pool.shutdown(wait=False, cancel_futures=True)
+
+async def render_certificate(invoice: Any) -> Tuple[Optional[bytes], Optional[str]]:
+    """Render one certificate on the certificate pool, returning ``(pdf_bytes, error)``.
+
+    A worker process dying breaks the pool and fails every render on it, so
+    the pool is replaced and each of those renders is retried once in a
+    process of its own, the same way ExtractionExecutor retries jobs.
+    """
+    global _certificate_retry_slots
+    from certificate_template import try_build_certificate_pdf
+
+    loop = asyncio.get_running_loop()
+    pool = get_certificate_pool()
+    try:
+        return await loop.run_in_executor(pool, try_build_certificate_pdf, invoice)
+    except BrokenProcessPool:
+        discard_certificate_pool(pool)
+    if _certificate_retry_slots is None:
+        _certificate_retry_slots = asyncio.Semaphore(max(1, CERTIFICATE_WORKERS))
+    async with _certificate_retry_slots:
+        solo = ProcessPoolExecutor(max_workers=1, initializer=warm_up_certificates if WARM_UP else None)
+        try:
+            return await loop.run_in_executor(solo, try_build_certificate_pdf, invoice)
+        finally:
+            solo.shutdown(wait=False)
+
+def ocr_engine_info() -> Dict[str, Any]:
+    """Name and Tesseract version of the OCR backend this process resolves to."""
+    engine = get_ocr_engine()
+    return {"name": engine.name, "tesseract_version": engine.version}
+
+def extraction_config(ocr_engine: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Everything that can change extraction or parsing output for the same file.
+
+    ``ocr_engine`` is the ocr_engine_info() of an extraction worker, so
+    switching backends or upgrading Tesseract invalidates cached results
+    without loading OpenCV or probing Tesseract in the server process.
+    """
+    return {
+        "parser_version": PARSER_VERSION,
+        "ocr_backend": OCR_BACKEND,
+        "ocr_engine": ocr_engine,
+        "ocr_oem": OCR_OEM,
+        "ocr_psm": OCR_PSM,
+        "ocr_whitelist": OCR_WHITELIST,
+        "ocr_raster_dpi": OCR_RASTER_DPI,
+        "image_decode": "grayscale",
+        "ocr_preprocess": OCR_PREPROCESS,
+        "ocr_text_height": OCR_TEXT_HEIGHT,
+        "text_layer_min_chars": TEXT_LAYER_MIN_CHARS,
+    }
+
+_result_cache: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache(ocr_engine: Optional[Dict[str, Any]] = None) -> Optional[ResultCache]:
+    """The result cache, or None when disabled. Created on first use, versioned for ``ocr_engine``."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None and RESULT_CACHE_ENABLED:
+            _result_cache = ResultCache(RESULT_CACHE_DIR, config_fingerprint(extraction_config(ocr_engine)),
+                                        RESULT_CACHE_ENTRIES, RESULT_CACHE_DISK_ENTRIES)
+    return _result_cache
+
+async def open_result_cache() -> Optional[ResultCache]:
+    """The result cache for the event loop, created on first use.
+
+    The OCR engine is probed in an extraction worker, where OCR actually
+    runs, and opening the cache touches the disk, so neither blocks the loop.
+    """
+    if _result_cache is not None or not RESULT_CACHE_ENABLED:
+        return _result_cache
+    ocr_engine = await extraction_executor.run(ocr_engine_info, wait=True)
+    return await asyncio.to_thread(get_result_cache, ocr_engine)
+
+invoice_store: Optional[InvoiceStore] = InvoiceStore(INVOICE_DB_PATH) if INVOICE_STORE_ENABLED else None
+
+def store_invoice(invoice_data: Dict[str, Any], digest: str, filename: str, cached: bool = False) -> Optional[int]:
+    """Save a parsed invoice to the invoice store, returning its id.
+
+    A ``cached`` result was already saved when it was extracted, so only its
+    id is looked up. Returns None when the store is disabled, extraction
+    failed (nothing worth keeping) or the write failed; the upload itself
+    still succeeds.
+    """
+    if invoice_store is None or not extraction_succeeded(invoice_data):
+        return None
+    try:
+        with timed_stage("invoice_store"):
+            invoice_id = invoice_store.id_for(digest) if cached else None
+            return invoice_id if invoice_id is not None else invoice_store.save(invoice_data, digest, filename)
+    except Exception as e:
+        logger.error(f"Error saving {filename} to the invoice store: {e}")
+        return None
+
+def with_invoice_id(invoice_data: Dict[str, Any], invoice_id: Optional[int]) -> Dict[str, Any]:
+    # A copy, since invoice_data may be shared with the result cache
+    return invoice_data if invoice_id is None else {**invoice_data, "invoice_id": invoice_id}
+
+job_store = JobStore(JOB_DB_PATH, os.path.join(JOB_DIR, "payloads"))
+def finish_job(result: Tuple[Dict[str, Any], Dict[str, float], Dict[str, str]]) -> Dict[str, Any]:
+    invoice_data, durations, source = result
+    record_extraction(invoice_data, durations)
+    return with_invoice_id(invoice_data, store_invoice(invoice_data, source["sha256"], source["filename"]))
+
+job_runner = JobRunner(job_store, run_extraction_job, JOB_WORKERS, JOB_LEASE_SECONDS, JOB_RESULT_TTL,
+                       on_result=finish_job, initializer=warm_up_extraction if WARM_UP else None)
+
+REGISTRY.register(Gauge("invoice_jobs", "Jobs in the queue by status", ("status",),
+                        callback=lambda: {(status,): n for status, n in job_store.counts().items()}))
+
+# Reported by /ready
+warm_up_status: Dict[str, Any] = {"ready": False, "warm_up": WARM_UP, "seconds": None, "error": None}
+_warm_up_task: Optional[asyncio.Task] = None
+
+async def warm_up():
+    """Load both pipelines in the server process, then start the worker pools.
+
+    Worker processes are forked after the imports, so they start with the
+    modules already loaded; the pool initializers cover the rest.
+    """
+    start = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, warm_up_extraction, EXTRACTION_EXECUTOR == "thread")
+        await loop.run_in_executor(None, warm_up_certificates)
+        pool = get_certificate_pool()
+        await asyncio.gather(extraction_executor.start(),
+                             *(loop.run_in_executor(pool, os.getpid) for _ in range(max(1, CERTIFICATE_WORKERS))))
+        await open_result_cache()
+    except Exception as e:
+        # Whatever failed is loaded again on first use; don't keep the server out of rotation
+        logger.error(f"Warm-up failed: {e}", exc_info=True)
+        warm_up_status["error"] = f"{type(e).__name__}: {e}"
+    warm_up_status["seconds"] = round(time.perf_counter() - start, 3)
+    warm_up_status["ready"] = True
+    logger.info(f"Warm-up finished in {warm_up_status['seconds']}s")
+
+@app.on_event("startup")
+async def start_job_runner():
+    global _warm_up_task
+    job_runner.start()
+    if WARM_UP:
+        _warm_up_task = asyncio.create_task(warm_up())
+    else:
+        warm_up_status["ready"] = True
+
+@app.on_event("shutdown")
+async def shutdown_extraction_executor():
+    await job_runner.stop()
+    extraction_executor.shutdown()
+    if _warm_up_task is not None:
+        _warm_up_task.cancel()
+    if certificate_pool is not None:
+        certificate_pool.shutdown(wait=False, cancel_futures=True)
+    if _ocr_engine is not None:
+        _ocr_engine.close()
+    if invoice_store is not None:
+        invoice_store.close()
+
+async def extract_invoice(upload: SpooledUpload, wait: bool = False):
+    """Extract and parse one uploaded invoice, using the result cache.
+
+    Returns ``(invoice_data, cache_status)`` where cache_status is "HIT" or
+    "MISS". Raises ExtractionQueueFull when the extraction pool is saturated,
+    unless ``wait`` is set.
+    """
+    is_pdf = upload.filename.lower().endswith('.pdf')
+    
+    # Answer repeat uploads of the same bytes from the cache
+    cache_key = upload.cache_key("pdf" if is_pdf else "image")
+    # The disk tier is read and written on a worker thread, off the event loop
+    result_cache = await open_result_cache()
+    if result_cache is not None:
+        with timed_stage("cache_lookup"):
+            cached = await asyncio.to_thread(result_cache.get, cache_key)
+        RESULT_CACHE_LOOKUPS.inc(result="miss" if cached is None else "hit")
+        if cached is not None:
+            logger.debug("Returning cached result")
+            return cached, "HIT"
+    
+    # Extract text and parse invoice data on the extraction pool. Small uploads
+    # are handed over as bytes, larger ones by the path of their spooled file.
+    logger.debug(f"Processing {'PDF' if is_pdf else 'image'} file ({upload.size} bytes, "
+                 f"{'in memory' if upload.in_memory else upload.path})")
+    start = time.perf_counter()
+    invoice_data, durations = await extraction_executor.run(run_extraction_timed, upload.source, is_pdf, wait=wait)
+    # Time spent waiting for a worker and moving data to and from it
+    durations["extraction_queue"] = max(0.0, time.perf_counter() - start - durations["extraction"])
+    record_extraction(invoice_data, durations)
+    
+    # Failed extractions are not cached so a retry gets another chance
+    if result_cache is not None and extraction_succeeded(invoice_data):
+        await asyncio.to_thread(result_cache.put, cache_key, invoice_data)
+    return invoice_data, "MISS"
+
+async def receive_upload(file: UploadFile) -> SpooledUpload:
+    """Stream an UploadFile into a size-limited SpooledUpload."""
+    with timed_stage("upload_read"):
+        return await read_upload(file, MAX_UPLOAD_BYTES, UPLOAD_SPOOL_BYTES, UPLOAD_DIR, UPLOAD_CHUNK_BYTES)
 
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
     """Upload and process invoice file"""
     try:
-        print(f"Received file: {file.filename}")
-        
-        # Create uploads directory if it doesn't exist
-        os.makedirs("uploads", exist_ok=True)
-        
-        # Save uploaded file
-        file_path = f"uploads/{file.filename}"
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
-        
-        print(f"File saved to: {file_path}")
-        
-        # Initialize parser
-        parser = InvoiceParser()
-        
-        # Extract text based on file type
-        if file.filename and file.filename.lower().endswith('.pdf'):
-            print("Processing PDF file")
-            extracted_text = parser.extract_text_from_pdf(file_path)
-        else:
-            print("Processing image file")
-            extracted_text = parser.extract_text_from_image(file_path)
+        logger.info(f"Received file: {file.filename}")
         
-        print(f"Extracted text length: {len(extracted_text) if extracted_text else 0}")
-        
-        # Parse invoice data
-        invoice_data = parser.parse_invoice_data(extracted_text)
-        
-        # Clean up uploaded file
-        os.remove(file_path)
+        try:
+            upload = await receive_upload(file)
+        except UploadTooLarge as e:
+            raise HTTPException(status_code=413, detail=str(e))
+        try:
+            invoice_data, cache_status = await extract_invoice(upload)
+        except ExtractionQueueFull as e:
+            raise HTTPException(status_code=503, detail=f"Server busy: {e}", headers={"Retry-After": "5"})
+        except BrokenProcessPool:
+            raise HTTPException(status_code=500, detail="Error processing file: the extraction worker crashed")
+        finally:
+            upload.close()
+        invoice_id = await asyncio.to_thread(store_invoice, invoice_data, upload.digest, upload.filename,
+                                             cache_status == "HIT")
         
-        print("File processing completed successfully")
-        return JSONResponse(content=invoice_data)
+        logger.info("File processing completed successfully")
+        with timed_stage("serialize"):
+            response = JSONResponse(content=with_invoice_id(invoice_data, invoice_id), headers={"X-Cache": cache_status})
+        return response
         
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error in upload_file: {str(e)}")
-        import traceback
-        traceback.print_exc()
+        logger.exception(f"Error in upload_file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error processing file: {str(e)}")
 
-@app.post("/generate-certificate")
-async def generate_certificate(invoice_data: Dict[str, Any]):
-    """Generate a redesigned, professional compliance certificate PDF."""
-    try:
-        buffer = io.BytesIO()
-        doc = SimpleDocTemplate(buffer, pagesize=letter, rightMargin=0.75*inch, leftMargin=0.5*inch, topMargin=0.5*inch, bottomMargin=0.5*inch)
-        styles = getSampleStyleSheet()
-        story: list[Flowable] = []
-
-        # Calculate total quantity from line items
-        total_quantity = 0
-        if invoice_data.get("items"):
-            for item in invoice_data["items"]:
+BATCH_SUPPORTED_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.webp')
+
+def _batch_sources(files: List[UploadFile]) -> List[Dict[str, Any]]:
+    """Expand uploaded files and ZIP archives into a list of invoices to ingest.
+
+    Each source has a ``filename`` and a ``read`` callable returning a
+    SpooledUpload, so file contents are only loaded once a worker slot is free.
+    """
+    sources: List[Dict[str, Any]] = []
+    for upload in files:
+        filename = upload.filename or ""
+        if not filename.lower().endswith('.zip'):
+            if not filename.lower().endswith(BATCH_SUPPORTED_EXTENSIONS):
+                sources.append({"filename": filename, "error": "Unsupported file type"})
+            else:
+                sources.append({"filename": filename, "read": (lambda upload=upload: receive_upload(upload))})
+            continue
+        try:
+            archive = zipfile.ZipFile(upload.file)
+        except zipfile.BadZipFile:
+            sources.append({"filename": filename, "error": "Not a valid ZIP archive"})
+            continue
+        for member in archive.infolist():
+            name = member.filename
+            if member.is_dir() or os.path.basename(name).startswith('.') or name.startswith('__MACOSX/'):
+                continue
+            if not name.lower().endswith(BATCH_SUPPORTED_EXTENSIONS):
+                sources.append({"filename": name, "error": "Unsupported file type"})
+            elif member.file_size > BATCH_MAX_MEMBER_BYTES:
+                sources.append({"filename": name, "error": f"File is larger than {BATCH_MAX_MEMBER_BYTES} bytes"})
+            else:
+                sources.append({"filename": name, "read": (lambda archive=archive, member=member: SpooledUpload.from_bytes(
+                    member.filename, archive.read(member), UPLOAD_SPOOL_BYTES, UPLOAD_DIR))})
+    return sources
+
+async def stream_batch_results(sources: List[Dict[str, Any]]):
+    """Run extraction for every source and yield one NDJSON line per invoice as it completes."""
+    semaphore = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+    results: asyncio.Queue = asyncio.Queue()
+
+    async def process(index: int, source: Dict[str, Any]):
+        line: Dict[str, Any] = {"index": index, "filename": source["filename"]}
+        try:
+            if "error" in source:
+                raise ValueError(source["error"])
+            async with semaphore:
+                upload = source["read"]()
+                if asyncio.iscoroutine(upload):
+                    upload = await upload
                 try:
-                    qty = float(item.get("qty", 0))
-                    total_quantity += qty
-                except (ValueError, TypeError):
-                    pass
-
-        # Extract shipping date (month and year) from due date
-        shipping_date = "N/A"
-        due_date = invoice_data.get('due_date', '')
-        if due_date:
-            try:
-                # Try to parse the due date and extract month/year
-                from datetime import datetime
-                # Handle common date formats
-                for fmt in ['%m/%d/%Y', '%Y-%m-%d', '%m-%d-%Y', '%d/%m/%Y']:
-                    try:
-                        parsed_date = datetime.strptime(due_date, fmt)
-                        shipping_date = parsed_date.strftime('%B %Y')
-                        break
-                    except ValueError:
-                        continue
-            except Exception:
-                shipping_date = "N/A"
-
-        # --- 0. Logo at Top Left, Title/Date Centered on Same Row ---
-        logo_path = os.path.join(os.path.dirname(__file__), 'amid-logo.jpeg')
-        max_logo_width = 1.2*inch
-        max_logo_height = 1.0*inch
-        if os.path.exists(logo_path):
-            pil_img = PILImage.open(logo_path)
-            w, h = pil_img.size
-            aspect = w / h
-            # Scale proportionally
-            logo_width = min(max_logo_width, max_logo_height * aspect)
-            logo_height = logo_width / aspect
-            if logo_height > max_logo_height:
-                logo_height = max_logo_height
-                logo_width = logo_height * aspect
-            logo_img = Image(logo_path, width=logo_width, height=logo_height)
-        else:
-            logo_width = max_logo_width
-            logo_img = Spacer(logo_width, max_logo_height)
-
-        # --- 1. Title/Date Centered ---
-        right_spacer = Spacer(logo_width, max_logo_height)
-        page_width = letter[0]
-        left_margin = 0.5*inch
-        right_margin = 0.75*inch
-        printable_width = page_width - left_margin - right_margin
-        center_col_width = printable_width - 2 * logo_width
-        header_right_style = ParagraphStyle(name='HeaderRight', parent=styles['Normal'], alignment=TA_CENTER, fontSize=14, leading=16)
-        header_right_text = f"<b>Certificate of Compliance</b><br/><b>Date: {invoice_data.get('date', 'N/A')}</b>"
-        header_para = Paragraph(header_right_text, header_right_style)
-        header_para_box = [RLSpacer(1, 0.3*inch), header_para]
-        header_table = Table(
-            [[logo_img, header_para_box, right_spacer]],
-            colWidths=[logo_width, center_col_width, logo_width],
-            hAlign='LEFT'
-        )
-        header_table.setStyle(TableStyle([
-            ('VALIGN', (0, 0), (0, 0), 'TOP'),
-            ('VALIGN', (1, 0), (1, 0), 'TOP'),
-            ('VALIGN', (2, 0), (2, 0), 'TOP'),
-            ('ALIGN', (1, 0), (1, 0), 'CENTER'),
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-            ('TOPPADDING', (0, 0), (-1, -1), 0),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-        ]))
-        story.append(header_table)
-        story.append(Spacer(1, 0.5*inch))
-
-        # --- 2. Customer and PO Details ---
-        details_style = ParagraphStyle(name='DetailsStyle', parent=styles['Normal'], spaceAfter=6)
-        story.append(Paragraph(f"<b>Customer:</b> {invoice_data.get('vendor_name', 'N/A')}", details_style))
-        story.append(Paragraph(f"<b>Customer Purchase Order No:</b> {invoice_data.get('po_number', 'N/A')}", details_style))
-        story.append(Paragraph(f"<b>Customer Purchase Number:</b> {invoice_data.get('customer_purchase_number', 'N/A')}", details_style))
-        story.append(Paragraph(f"<b>Shipping Date:</b> {shipping_date}", details_style))
-        story.append(Paragraph(f"<b>Total Quantity:</b> {total_quantity:,.0f}", details_style))
-        story.append(Spacer(1, 0.25*inch))
-        
-        # --- 3. Certification Text (Part 1) ---
-        body_style = ParagraphStyle(name='BodyStyle', parent=styles['Normal'], spaceAfter=12)
-        certification_text = (
-            "We certify that all materials, and products listed below have been assembled, produced, "
-            "inspected, and tested in full accordance with all applicable specifications, drawings, and "
-            "other purchase requirements. Test reports and/or suitable evidence of compliance are on file "
-            "and are available from the manufacturer. "
-            "Amid Technologies has established a known chain of custody for the material originating from the OEM."
-        )
-        story.append(Paragraph(certification_text, body_style))
-        story.append(Spacer(1, 0.25*inch))
-
-        # --- 4. Line Items Table (Single Table Format) ---
-        product_table_data = [
-            [
-                Paragraph('<b>Product Code</b>', styles['Normal']),
-                Paragraph('<b>Description</b>', styles['Normal']),
-                Paragraph('<b>Quantity</b>', styles['Normal']),
-                Paragraph('<b>Date Code</b>', styles['Normal'])
-            ]
-        ]
-        if invoice_data.get("items"):
-            for item in invoice_data["items"]:
-                product_table_data.append([
-                    Paragraph(item.get("product_code", ""), styles['Normal']),
-                    Paragraph(item.get("description", ""), styles['Normal']),
-                    Paragraph(f"{item.get('qty', 0):,}", styles['Normal']),
-                    Paragraph(item.get("date_code", ""), styles['Normal'])
-                ])
-        product_table = Table(product_table_data, colWidths=[2.2*inch, 3.2*inch, 1.0*inch, 1.1*inch], hAlign='LEFT')
-        product_table.setStyle(TableStyle([
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-            ('ALIGN', (2, 1), (2, -1), 'RIGHT'),
-            ('ALIGN', (0, 1), (1, -1), 'LEFT'),
-            ('ALIGN', (3, 1), (3, -1), 'LEFT'),
-            ('TOPPADDING', (0, 0), (-1, -1), 4),
-            ('BOTTOMPADDING', (0, 0), (-1, -1), 4),
-            ('LEFTPADDING', (0, 0), (-1, -1), 6),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 6),
-            ('BOX', (0, 0), (-1, -1), 1, colors.black),
-            ('INNERGRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ]))
-        story.append(product_table)
-        story.append(Spacer(1, 0.25*inch))
-
-        # --- 5. Signature Block ---
-        signature_style = ParagraphStyle(name='SignatureStyle', parent=styles['Normal'], alignment=TA_CENTER, spaceAfter=0, spaceBefore=0, leading=10)
-        # Use a single table for the signature block to control spacing tightly
-        signature_table = Table([
-            [Paragraph("Dima Minin", signature_style)],
-            [Paragraph("____________________________", signature_style)],
-            [Paragraph("Amid Technologies Inc", signature_style)],
-            [Paragraph("<b>Manufacturer's Representative</b>", signature_style)]
-        ], colWidths=[3*inch], hAlign='CENTER', style=TableStyle([
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('VALIGN', (0, 0), (-1, -1), 'BOTTOM'),
-            ('TOPPADDING', (0, 0), (0, 0), 0),
-            ('BOTTOMPADDING', (0, 0), (0, 0), 0),
-            ('TOPPADDING', (0, 1), (0, 1), 0),
-            ('BOTTOMPADDING', (0, 1), (0, 1), 0),
-            ('TOPPADDING', (0, 2), (0, 2), 6),
-            ('BOTTOMPADDING', (0, 2), (0, 2), 0),
-            ('TOPPADDING', (0, 3), (0, 3), 0),
-            ('BOTTOMPADDING', (0, 3), (0, 3), 0),
-            ('LEFTPADDING', (0, 0), (-1, -1), 0),
-            ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ]))
-        signature_block = [
-            Spacer(1, 0.25*inch),  # Move signature block further down
-            signature_table,
-            Spacer(1, 0.1*inch)
-        ]
+                    # Batch items have no retry, so they wait for room behind /upload traffic
+                    invoice_data, cache_status = await extract_invoice(upload, wait=True)
+                finally:
+                    upload.close()
+            if extraction_succeeded(invoice_data):
+                invoice_id = await asyncio.to_thread(store_invoice, invoice_data, upload.digest, source["filename"],
+                                                     cache_status == "HIT")
+                line.update(status="ok", cache=cache_status, invoice_id=invoice_id, data=invoice_data)
+            else:
+                line.update(status="error", error="Could not read every page of the document",
+                            extraction=invoice_data["extraction"])
+        except BrokenProcessPool:
+            line.update(status="error", error="The extraction worker crashed")
+        except Exception as e:
+            logger.warning(f"Error processing {source['filename']} in batch: {e}")
+            line.update(status="error", error=str(e))
+        await results.put(line)
 
-        # --- 6. Assemble Story with Conditional KeepTogether ---
-        if len(product_table_data) <= 5:  # 1 header + 4 products
-            story_content = story + signature_block
-            story = [KeepTogether(story_content)]
-        else:
-            story.extend(signature_block)
+    tasks = [asyncio.create_task(process(i, source)) for i, source in enumerate(sources)]
+    succeeded = 0
+    try:
+        for _ in range(len(tasks)):
+            line = await results.get()
+            succeeded += line["status"] == "ok"
+            yield json.dumps(line) + "\n"
+        yield json.dumps({"done": True, "total": len(tasks), "succeeded": succeeded,
+                          "failed": len(tasks) - succeeded}) + "\n"
+    finally:
+        # Stop outstanding work if the client goes away
+        for task in tasks:
+            task.cancel()
+
+@app.post("/upload/batch")
+async def upload_batch(files: List[UploadFile] = File(...)):
+    """Ingest many invoices at once, from several files and/or ZIP archives.
+
+    Streams ``application/x-ndjson``: one line per invoice in completion
+    order (``status`` is "ok" with ``data``, or "error" with ``error``),
+    followed by a final ``{"done": true, ...}`` summary line.
+    """
+    sources = _batch_sources(files)
+    if not sources:
+        raise HTTPException(status_code=400, detail="No invoice files in the upload")
+    if len(sources) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_FILES} invoices per batch")
+    return StreamingResponse(stream_batch_results(sources), media_type="application/x-ndjson")
+
+def certificate_filename(invoice_data: Dict[str, Any]) -> str:
+    """Download filename for a certificate, based on the PO number."""
+    po_number = re.sub(r"[^A-Za-z0-9._-]+", "_", str(invoice_data.get("po_number") or "")).strip("._")
+    return f"{po_number or 'certificate'}.pdf"
 
-        doc.build(story)
-        buffer.seek(0)
+@app.post("/generate-certificate")
+async def generate_certificate(invoice_data: Dict[str, Any], format: str = "pdf"):
+    """Generate a compliance certificate.
+
+    Returns the PDF as ``application/pdf`` by default. ``?format=hex`` returns
+    the legacy ``{"pdf_data": "<hex>"}`` JSON body instead.
+    """
+    if format not in ("pdf", "hex"):
+        raise HTTPException(status_code=400, detail="format must be 'pdf' or 'hex'")
+    try:
+        from certificate_template import build_certificate_pdf
         
-        return JSONResponse(
-            content={"pdf_data": buffer.getvalue().hex()},
-            headers={"Content-Type": "application/json"}
+        with timed_stage("certificate_render"):
+            pdf_bytes = build_certificate_pdf(invoice_data)
+        CERTIFICATES.inc(status="ok")
+        
+        if format == "hex":
+            return JSONResponse(
+                content={"pdf_data": pdf_bytes.hex()},
+                headers={"Content-Type": "application/json"}
+            )
+        return Response(
+            content=pdf_bytes,
+            media_type="application/pdf",
+            headers={"Content-Disposition": f'attachment; filename="{certificate_filename(invoice_data)}"'}
         )
         
     except Exception as e:
-        logging.error(f"Failed to generate certificate: {e}", exc_info=True)
+        CERTIFICATES.inc(status="error")
+        logger.error(f"Failed to generate certificate: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error generating certificate: {str(e)}")
 
+def _quantity(value: Any) -> Union[int, float]:
+    """A parsed quantity such as "1,250" as a number (0 if it isn't one)."""
+    try:
+        number = float(re.sub(r"[^\d.]", "", str(value or "")) or 0)
+    except ValueError:
+        return 0
+    return int(number) if number.is_integer() else number
+
+def certificate_payload(invoice: Dict[str, Any]) -> Dict[str, Any]:
+    """The /generate-certificate payload for a stored invoice, mapped the way the client maps a parsed one."""
+    return {
+        "invoice_number": invoice.get("invoice_number", ""),
+        "date": invoice.get("date", ""),
+        "due_date": invoice.get("due_date", ""),
+        "po_number": invoice.get("po_number", ""),
+        "customer_purchase_number": "",
+        "vendor_name": invoice.get("vendor_name", ""),
+        "total_amount": invoice.get("total_amount", ""),
+        "items": [
+            {
+                "product_code": item.get("product_code", ""),
+                "description": item.get("description", ""),
+                "qty": _quantity(item.get("quantity")),
+                "rate": item.get("rate", ""),
+                "amount": item.get("amount", ""),
+                "date_code": item.get("date_code", ""),
+            }
+            for item in invoice.get("line_items") or []
+        ],
+    }
+
+async def render_certificates(invoices: List[Any]):
+    """Render certificates on the certificate pool, yielding ``(index, pdf_bytes, error)`` in input order.
+
+    At most CERTIFICATE_BATCH_WINDOW renders are in flight (or finished but
+    not yet consumed) at any time, which bounds memory for large batches.
+    """
+    pending: deque = deque()
+    window = max(1, CERTIFICATE_BATCH_WINDOW)
+    next_index = 0
+    try:
+        while next_index < len(invoices) or pending:
+            while next_index < len(invoices) and len(pending) < window:
+                pending.append((next_index, asyncio.ensure_future(render_certificate(invoices[next_index]))))
+                next_index += 1
+            index, future = pending.popleft()
+            try:
+                pdf_bytes, error = await future
+            except Exception as e:
+                # e.g. this render killed its worker again, even in a process of its own
+                pdf_bytes, error = None, f"{type(e).__name__}: {e}"
+            CERTIFICATES.inc(status="error" if error else "ok")
+            yield index, pdf_bytes, error
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+class _ZipStreamSink:
+    """Write-only file object that collects zip output until it is drained."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def _batch_error(index: int, invoice_data: Any, error: str) -> Dict[str, Any]:
+    po_number = invoice_data.get("po_number") if isinstance(invoice_data, dict) else None
+    return {"index": index, "po_number": po_number, "error": error}
+
+async def stream_certificates_zip(invoices: List[Any]):
+    """Stream a ZIP of certificates as they are rendered, plus errors.json when any item failed."""
+    sink = _ZipStreamSink()
+    errors = []
+    with zipfile.ZipFile(sink, "w", zipfile.ZIP_DEFLATED) as archive:
+        async for index, pdf_bytes, error in render_certificates(invoices):
+            if error:
+                errors.append(_batch_error(index, invoices[index], error))
+                continue
+            archive.writestr(f"{index + 1:04d}_{certificate_filename(invoices[index])}", pdf_bytes)
+            yield sink.drain()
+        if errors:
+            archive.writestr("errors.json", json.dumps(errors, indent=2))
+    yield sink.drain()
+
+async def merge_certificates(invoices: List[Any]):
+    """Render certificates and merge them into one PDF, returning ``(file, errors)``."""
+    from pypdf import PdfWriter
+
+    writer = PdfWriter()
+    errors = []
+    async for index, pdf_bytes, error in render_certificates(invoices):
+        if error:
+            errors.append(_batch_error(index, invoices[index], error))
+            continue
+        writer.append(io.BytesIO(pdf_bytes))
+    output = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    if len(writer.pages):
+        writer.write(output)
+    writer.close()
+    output.seek(0)
+    return output, errors
+
+def _iter_file(f, chunk_size: int = 64 * 1024):
+    try:
+        while chunk := f.read(chunk_size):
+            yield chunk
+    finally:
+        f.close()
+
+@app.post("/generate-certificates")
+async def generate_certificates(payload: Dict[str, Any], format: str = "zip"):
+    """Generate certificates for many invoices at once.
+
+    The body is ``{"invoices": [<invoice payload>, ...]}`` using the same
+    payload as /generate-certificate. ``?format=zip`` (default) streams a ZIP
+    of individual PDFs; failed items are listed in its ``errors.json``.
+    ``?format=pdf`` returns one merged PDF and lists failed items in the
+    ``X-Certificate-Errors`` header.
+    """
+    invoices = payload.get("invoices")
+    if not isinstance(invoices, list) or not invoices:
+        raise HTTPException(status_code=400, detail="'invoices' must be a non-empty list")
+    if format not in ("zip", "pdf"):
+        raise HTTPException(status_code=400, detail="format must be 'zip' or 'pdf'")
+    max_items = CERTIFICATE_BATCH_MAX_ITEMS if format == "zip" else min(CERTIFICATE_BATCH_MAX_ITEMS, CERTIFICATE_MERGE_MAX_ITEMS)
+    if len(invoices) > max_items:
+        raise HTTPException(status_code=413, detail=f"At most {max_items} invoices per batch for format={format}")
+
+    if format == "zip":
+        return StreamingResponse(
+            stream_certificates_zip(invoices),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="certificates.zip"'}
+        )
+
+    try:
+        output, errors = await merge_certificates(invoices)
+    except Exception as e:
+        logger.error(f"Failed to merge certificates: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error generating certificates: {str(e)}")
+    if len(errors) == len(invoices):
+        output.close()
+        raise HTTPException(status_code=422, detail={"message": "No certificate could be generated", "errors": errors})
+    headers = {"Content-Disposition": 'attachment; filename="certificates.pdf"'}
+    if errors:
+        headers["X-Certificate-Errors"] = json.dumps([{"index": e["index"], "error": e["error"][:200]} for e in errors[:50]])
+    return StreamingResponse(_iter_file(output), media_type="application/pdf", headers=headers)
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Public view of a job row."""
+    status = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["error"]:
+        status["error"] = job["error"]
+    if job["result"] is not None:
+        status["result"] = job["result"]
+    return status
+
+@app.post("/jobs", status_code=202)
+async def submit_job(file: UploadFile = File(...)):
+    """Queue an invoice for extraction and return its job id immediately"""
+    filename = file.filename or ""
+    if not filename.lower().endswith(BATCH_SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {filename}")
+    try:
+        upload = await receive_upload(file)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    try:
+        job_id = await asyncio.to_thread(job_store.submit, filename, upload.source, JOB_MAX_ATTEMPTS, JOB_QUEUE_LIMIT)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=503, detail=f"Server busy: {e}", headers={"Retry-After": "30"})
+    finally:
+        upload.close()
+    job_runner.notify()
+    logger.info(f"Queued job {job_id} for {filename}")
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status": "queued",
+            "status_url": f"/jobs/{job_id}",
+            "events_url": f"/jobs/{job_id}/events",
+        },
+        headers={"Location": f"/jobs/{job_id}"},
+    )
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status of a job, with its result once it has succeeded"""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_status(job)
+
+async def stream_job_events(job_id: str):
+    """Server-sent events: one ``status`` event per change, then ``result`` or ``error``."""
+    last = None
+    while True:
+        job = await asyncio.to_thread(job_store.get, job_id)
+        if job is None:
+            yield "event: error\ndata: " + json.dumps({"job_id": job_id, "error": "Job not found"}) + "\n\n"
+            return
+        status = job_status(job)
+        if (job["status"], job["attempts"]) != last:
+            last = (job["status"], job["attempts"])
+            summary = {k: v for k, v in status.items() if k != "result"}
+            yield "event: status\ndata: " + json.dumps(summary) + "\n\n"
+        if job["status"] in FINISHED_STATUSES:
+            event = "result" if job["status"] == "succeeded" else "error"
+            yield f"event: {event}\ndata: " + json.dumps(status) + "\n\n"
+            return
+        await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Subscribe to a job's status changes as server-sent events"""
+    if await asyncio.to_thread(job_store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(stream_job_events(job_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/jobs")
+async def job_counts():
+    """Number of jobs in each status"""
+    return await asyncio.to_thread(job_store.counts)
+
+def get_invoice_store() -> InvoiceStore:
+    if invoice_store is None:
+        raise HTTPException(status_code=404, detail="The invoice store is disabled")
+    return invoice_store
+
+@app.get("/invoices")
+async def find_invoices(invoice_number: Optional[str] = None, po_number: Optional[str] = None,
+                        vendor_name: Optional[str] = None, product_code: Optional[str] = None,
+                        date_from: Optional[str] = None, date_to: Optional[str] = None,
+                        limit: int = 50, offset: int = 0):
+    """Look up stored invoices by header fields, line item product code and/or invoice date range"""
+    limit = min(max(1, limit), INVOICE_LOOKUP_MAX_RESULTS)
+    invoices = get_invoice_store().find(invoice_number, po_number, vendor_name, product_code, date_from, date_to,
+                                        limit, max(0, offset))
+    return {"invoices": invoices, "limit": limit, "offset": max(0, offset)}
+
+@app.get("/invoices/search")
+async def search_invoices(q: str, limit: int = 20):
+    """Full-text search over the raw text of stored invoices"""
+    limit = min(max(1, limit), INVOICE_LOOKUP_MAX_RESULTS)
+    return {"invoices": get_invoice_store().search(q, limit)}
+
+@app.get("/invoices/{invoice_id}")
+async def get_invoice(invoice_id: int):
+    """A stored invoice as /upload returned it"""
+    invoice = get_invoice_store().get(invoice_id)
+    if invoice is None:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return invoice
+
+@app.post("/invoices/{invoice_id}/certificate")
+async def generate_invoice_certificate(invoice_id: int, format: str = "pdf",
+                                       overrides: Optional[Dict[str, Any]] = Body(None)):
+    """Generate the certificate for a stored invoice without uploading it again.
+
+    An optional JSON body overrides fields of the certificate payload, e.g.
+    ``customer_purchase_number`` or ``items`` with date codes filled in.
+    """
+    invoice = get_invoice_store().get(invoice_id)
+    if invoice is None:
+        raise HTTPException(status_code=404, detail="Invoice not found")
+    return await generate_certificate({**certificate_payload(invoice), **(overrides or {})}, format)
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters for the /upload result cache"""
+    result_cache = await open_result_cache()
+    if result_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **result_cache.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics in the text exposition format"""
+    # On a worker thread, since the invoice_jobs gauge queries the job store
+    return Response(content=await asyncio.to_thread(REGISTRY.render), media_type=CONTENT_TYPE)
+
 @app.get("/")
 async def root():
     return {"message": "Invoice Certification API is running"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until the startup warm-up (WARM_UP=1) has finished"""
+    if not warm_up_status["ready"]:
+        return JSONResponse(status_code=503, content=warm_up_status)
+    return warm_up_status
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,154 @@
+"""OCR backends used by InvoiceParser.
+
+Two backends are available:
+
+* ``tesserocr`` keeps a pool of long-lived, pre-initialized Tesseract API
+  objects in process, so each page skips the process launch and the
+  traineddata load. It needs the optional ``tesserocr`` package.
+* ``pytesseract`` launches the ``tesseract`` executable once per image. It is
+  always available as a fallback.
+
+Availability is detected once, when the backend is created. Neither
+Tesseract binding is imported until then.
+"""
+import logging
+import queue
+import threading
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator, List, Optional
+
+if TYPE_CHECKING:
+    import numpy as np
+
+logger = logging.getLogger(__name__)
+
+OCR_LANG = "eng"
+OCR_OEM = 3
+OCR_PSM = 6
+# Passed verbatim to both backends, so it must not contain whitespace, quotes or
+# backslashes (pytesseract shell-splits its config string)
+OCR_WHITELIST = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz.,$%()/-"
+
+
+class PytesseractBackend:
+    """Runs the tesseract executable through pytesseract for every image."""
+
+    name = "pytesseract"
+
+    def __init__(self):
+        import pytesseract
+
+        self._pytesseract = pytesseract
+        self.config = f"--oem {OCR_OEM} --psm {OCR_PSM} -c tessedit_char_whitelist={OCR_WHITELIST}"
+        try:
+            self.version: Optional[str] = str(pytesseract.get_tesseract_version())
+        except Exception:
+            self.version = None
+
+    @property
+    def available(self) -> bool:
+        return self.version is not None
+
+    def recognize(self, image: "np.ndarray") -> str:
+        return self._pytesseract.image_to_string(image, lang=OCR_LANG, config=self.config)
+
+    def warm_up(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class TesserocrBackend:
+    """Pool of in-process Tesseract engines configured once and reused across pages."""
+
+    name = "tesserocr"
+
+    def __init__(self, pool_size: int = 2, tessdata_path: Optional[str] = None):
+        import tesserocr
+
+        self._tesserocr = tesserocr
+        self.version: Optional[str] = tesserocr.tesseract_version().split()[1]
+        self.pool_size = max(1, pool_size)
+        self.tessdata_path = tessdata_path
+        self._idle: "queue.Queue" = queue.Queue()
+        self._engines: List = []
+        self._lock = threading.Lock()
+        # Fail here, not on the first page, if the traineddata can't be loaded
+        self._create_engine().End()
+
+    @property
+    def available(self) -> bool:
+        return True
+
+    def _create_engine(self):
+        tesserocr = self._tesserocr
+        kwargs = {"lang": OCR_LANG, "oem": tesserocr.OEM(OCR_OEM), "psm": tesserocr.PSM(OCR_PSM)}
+        if self.tessdata_path:
+            kwargs["path"] = self.tessdata_path
+        engine = tesserocr.PyTessBaseAPI(**kwargs)
+        engine.SetVariable("tessedit_char_whitelist", OCR_WHITELIST)
+        return engine
+
+    @contextmanager
+    def _engine(self) -> Iterator:
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            engine = None
+            with self._lock:
+                if len(self._engines) < self.pool_size:
+                    engine = self._create_engine()
+                    self._engines.append(engine)
+            if engine is None:
+                # Every engine is busy; wait for one to be released
+                engine = self._idle.get()
+        try:
+            yield engine
+        finally:
+            self._idle.put(engine)
+
+    def recognize(self, image: "np.ndarray") -> str:
+        import numpy as np
+
+        image = np.ascontiguousarray(image)
+        height, width = image.shape[:2]
+        channels = 1 if image.ndim == 2 else image.shape[2]
+        with self._engine() as engine:
+            engine.SetImageBytes(image.tobytes(), width, height, channels, width * channels)
+            text = engine.GetUTF8Text()
+            engine.Clear()
+        return text
+
+    def warm_up(self):
+        """Create every engine in the pool ahead of the first request."""
+        with self._lock:
+            while len(self._engines) < self.pool_size:
+                engine = self._create_engine()
+                self._engines.append(engine)
+                self._idle.put(engine)
+
+    def close(self):
+        with self._lock:
+            for engine in self._engines:
+                engine.End()
+            self._engines = []
+            self._idle = queue.Queue()
+
+
+def create_ocr_backend(backend: str = "auto", pool_size: int = 2, tessdata_path: Optional[str] = None):
+    """Create the configured OCR backend.
+
+    ``auto`` prefers the pooled tesserocr engines and falls back to pytesseract
+    when tesserocr is not installed or cannot initialize.
+    """
+    if backend not in ("auto", "tesserocr", "pytesseract"):
+        raise ValueError(f"Unknown OCR backend: {backend}")
+    if backend in ("auto", "tesserocr"):
+        try:
+            return TesserocrBackend(pool_size, tessdata_path)
+        except Exception as e:
+            if backend == "tesserocr":
+                raise
+            logger.info(f"tesserocr not available ({e}), using pytesseract")
+    return PytesseractBackend()
@@ -0,0 +1,166 @@
+"""Content-addressed cache for /upload extraction results.
+
+Results are keyed on a hash of the uploaded bytes and live in two tiers: a
+size-bounded in-memory LRU and a JSON-file store on disk that survives
+restarts. Every entry belongs to a ``version`` (a fingerprint of the parser and
+OCR configuration); entries written under any other version are never read and
+their directories are removed when the cache is opened.
+
+The cache is thread-safe, so the disk tier can be used from worker threads
+rather than the event loop.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+def content_key(content: bytes, kind: str = "") -> str:
+    """Return the cache key for an uploaded file's bytes."""
+    return digest_key(hashlib.sha256(content).hexdigest(), kind)
+
+
+def digest_key(digest: str, kind: str = "") -> str:
+    """Return the cache key for a file whose SHA-256 hex digest is already known."""
+    return f"{kind}-{digest}" if kind else digest
+
+
+def config_fingerprint(config: Dict[str, Any]) -> str:
+    """Return a short, stable fingerprint of a configuration dict."""
+    encoded = json.dumps(config, sort_keys=True, default=str).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+
+class ResultCache:
+    def __init__(self, directory: Optional[str], version: str, max_entries: int = 256,
+                 max_disk_entries: int = 10000):
+        self.version = version
+        self.max_entries = max(0, max_entries)
+        self.max_disk_entries = max(0, max_disk_entries)
+        self._memory: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self._lock = threading.Lock()
+
+        self.directory = None
+        self._disk_entries = 0
+        if directory:
+            self.directory = os.path.join(directory, version)
+            os.makedirs(self.directory, exist_ok=True)
+            self._remove_stale_versions(directory)
+            self._disk_entries = sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def _remove_stale_versions(self, root: str):
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name != self.version and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached result for ``key``, or None on a miss."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return value
+
+        if self.directory:
+            try:
+                with open(self._disk_path(key), "r", encoding="utf-8") as f:
+                    value = json.load(f)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """Store ``value`` in both tiers."""
+        self._remember(key, value)
+        if not self.directory:
+            return
+        path = self._disk_path(key)
+        is_new = not os.path.exists(path)
+        # Write to a temp file first so readers never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        if is_new:
+            with self._lock:
+                self._disk_entries += 1
+                if self._disk_entries > self.max_disk_entries:
+                    self._prune_disk()
+
+    def _remember(self, key: str, value: Dict[str, Any]):
+        if self.max_entries == 0:
+            return
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _prune_disk(self):
+        """Drop the least recently written tenth of the disk tier."""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                try:
+                    entries.append((os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        entries.sort()
+        excess = len(entries) - self.max_disk_entries
+        for _, path in entries[:max(excess, self.max_disk_entries // 10)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self._disk_entries = sum(1 for name in os.listdir(self.directory) if name.endswith(".json"))
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.directory:
+                shutil.rmtree(self.directory, ignore_errors=True)
+                os.makedirs(self.directory, exist_ok=True)
+                self._disk_entries = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "version": self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "memory_capacity": self.max_entries,
+            "disk_entries": self._disk_entries,
+        }
@@ -0,0 +1,177 @@
+"""Streaming, size-limited handling of uploaded invoice files.
+
+Uploads are copied in chunks into a SpooledUpload, which keeps small files
+in memory and moves larger ones to a uniquely named temporary file, hashing
+the bytes on the way for the result cache. BodySizeLimitMiddleware rejects
+oversized requests with 413 before their body is parsed.
+"""
+import hashlib
+import io
+import json
+import os
+import tempfile
+from typing import Dict, Optional, Union
+
+from fastapi import UploadFile
+
+from result_cache import digest_key
+
+
+class UploadTooLarge(Exception):
+    """Raised when an upload is larger than the configured maximum."""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File is larger than the {max_bytes} byte limit")
+        self.max_bytes = max_bytes
+
+
+class SpooledUpload:
+    """An uploaded file held in memory, or in a unique temporary file once it outgrows ``spool_bytes``."""
+
+    def __init__(self, filename: str, spool_bytes: int, directory: str = "uploads",
+                 max_bytes: Optional[int] = None):
+        self.filename = filename
+        self.spool_bytes = spool_bytes
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.path: Optional[str] = None
+        self._sha256 = hashlib.sha256()
+        self._buffer: Optional[io.BytesIO] = io.BytesIO()
+        self._file = None
+
+    @classmethod
+    def from_bytes(cls, filename: str, content: bytes, spool_bytes: int, directory: str = "uploads"):
+        upload = cls(filename, spool_bytes, directory)
+        upload.write(content)
+        upload.finish()
+        return upload
+
+    def write(self, chunk: bytes):
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self._sha256.update(chunk)
+        if self._file is None and self.size > self.spool_bytes:
+            # Past the threshold: move what we have so far to disk and continue there
+            os.makedirs(self.directory, exist_ok=True)
+            fd, self.path = tempfile.mkstemp(dir=self.directory, suffix=os.path.splitext(self.filename)[1])
+            self._file = os.fdopen(fd, "wb")
+            self._file.write(self._buffer.getbuffer())
+            self._buffer = None
+        (self._file or self._buffer).write(chunk)
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+
+    @property
+    def in_memory(self) -> bool:
+        return self.path is None
+
+    @property
+    def source(self) -> Union[bytes, str]:
+        """The content for the extraction worker: bytes if in memory, otherwise the file path."""
+        return self._buffer.getvalue() if self.in_memory else self.path
+
+    @property
+    def digest(self) -> str:
+        """SHA-256 of the content, hex-encoded."""
+        return self._sha256.hexdigest()
+
+    def cache_key(self, kind: str = "") -> str:
+        """Same key as result_cache.content_key on the full content."""
+        return digest_key(self.digest, kind)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+        self._buffer = None
+
+
+async def read_upload(file: UploadFile, max_bytes: int, spool_bytes: int, directory: str = "uploads",
+                      chunk_size: int = 1024 * 1024) -> SpooledUpload:
+    """Copy an UploadFile into a SpooledUpload chunk by chunk.
+
+    Raises UploadTooLarge as soon as more than ``max_bytes`` have been read.
+    """
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(max_bytes)
+    upload = SpooledUpload(file.filename or "", spool_bytes, directory, max_bytes)
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+            upload.write(chunk)
+        upload.finish()
+    except BaseException:
+        upload.close()
+        raise
+    return upload
+
+
+class BodySizeLimitMiddleware:
+    """Answer 413 for requests to the given paths whose body exceeds its limit.
+
+    A too-large ``Content-Length`` is rejected before anything is read; a
+    body without one is cut off as soon as it goes over the limit.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = limits
+
+    @staticmethod
+    async def _reject(send, limit: int):
+        body = json.dumps({"detail": f"Request body is larger than the {limit} byte limit"}).encode()
+        await send({"type": "http.response.start", "status": 413,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        limit = self.limits.get(scope.get("path")) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > limit:
+            await self._reject(send, limit)
+            return
+
+        received = 0
+        too_large = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Stop reading; the app's error response is replaced below
+                    too_large = True
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def checked_send(message):
+            nonlocal rejected
+            if too_large:
+                if message["type"] == "http.response.start" and not rejected:
+                    rejected = True
+                    await self._reject(send, limit)
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, checked_send)
+        except Exception:
+            # Reading a cut-off body can fail in many ways; those are all the 413
+            if not too_large:
+                raise
+        if too_large and not rejected:
+            await self._reject(send, limit)